@@ -8,7 +8,7 @@ from scipy.linalg import det, eig, inv, norm
 
 from .io import read_gth
 from .logger import create_logger, get_level, log
-from .operators import I, Idag, J, Jdag, K, L, Linv, O, T
+from .operators import dot, I, Idag, J, Jdag, K, L, Linv, O, T
 from .tools import center_of_mass, cutoff2gridspacing, inertia_tensor
 
 
@@ -71,6 +71,35 @@ class Atoms:
             of Z by it.
 
             Default: None
+        Nblock (int | None): Number of states that will be transformed at once when applying local
+            potentials.
+
+            This bounds the memory needed for the real-space representation of the states. None
+            will transform all states at once.
+
+            Default: 16
+        dual (float): Ratio of the density and the wave function cut-off energies.
+
+            The default sampling can represent densities up to four times ecut. Larger values will
+            build a finer density sampling to evaluate the exchange-correlation functional, while
+            the wave functions will still be transformed on the smaller sampling. This has no effect
+            if ecut is None.
+
+            Example: 4; 9; 16,
+            Default: 4
+        prune (bool): Use sphere-pruned FFTs to transform from and to the active space.
+
+            Only the 1d columns and planes of the grid that contain active G-vectors will be
+            transformed. This has no effect if ecut is None.
+
+            Default: False
+        gamma (bool): Use real-valued wave functions, since only the Gamma-point is sampled.
+
+            Only one G-vector of every pair G and -G will be stored in the active space, the other
+            coefficient follows from W(-G) = W(G)^*. The wave functions will be transformed with
+            real-to-complex FFTs, and overlaps will be real-valued. Pruned FFTs will not be used.
+
+            Default: False
         verbose (int | str | None): Level of output (case insensitive).
 
             Can be one of 'CRITICAL', 'ERROR', 'WARNING', 'INFO', or 'DEBUG'.
@@ -81,7 +110,8 @@ class Atoms:
             Default: 'info'
     '''
     def __init__(self, atom, X, a=20, ecut=30, Z=None, s=None, center=False, Nspin=2, f=None,
-                 Nstate=None, verbose='info'):
+                 Nstate=None, Nblock=16, dual=4, prune=False, gamma=False,
+                 verbose='info'):
         self.atom = atom      # Atom symbols
         self.X = X            # Atom positions
         self.a = a            # Cell/Vacuum size
@@ -92,11 +122,16 @@ class Atoms:
         self.Nspin = Nspin    # Number of spin states
         self.f = f            # Occupation numbers
         self.Nstate = Nstate  # Number of states
+        self.Nblock = Nblock  # Number of states per block
+        self.dual = dual      # Ratio of density and wave function cut-off energies
+        self.prune = prune    # Use sphere-pruned FFTs
+        self.gamma = gamma    # Use real-valued wave functions
 
         # Set up parameters that should not be cleared
         self.Natoms = None     # Number of atoms
         self.R = None          # Cell
         self.Omega = None      # Cell volume
+        self.s_dens = None     # Density sampling
         self.clear()
 
         # Initialize logger and update
@@ -112,8 +147,15 @@ class Atoms:
         self.r = None          # Sample points in cell
         self.G = None          # G-vectors
         self.G2 = None         # Squared magnitudes of G-vectors
-        self.active = None     # Mask for active G-vectors
+        self.active = None     # Indices of active G-vectors
         self.G2c = None        # Truncated squared magnitudes of G-vectors
+        self.half = None       # Indices of the half spectrum used for real-valued fields
+        self.neg = None        # Indices of the negated G-vectors
+        self.workspace = None  # Zero-padded buffer per data type to transform from the active space
+        self.pencils = None    # Indices of the active space in the non-zero pencils and planes
+        self.dens_idx = None   # Indices of the components shared by both samplings
+        self.gamma_idx = None  # Indices of the active space in the half spectrum
+        self.gamma_w = None    # Weights of the active G-vectors in overlaps
         self.Sf = None         # Structure factor
         self.is_built = False  # Flag to determine if the object was built or not
         return self
@@ -232,6 +274,14 @@ class Atoms:
             self.s = self.s * np.ones(3, dtype=int)
         if isinstance(self.s, (list, tuple)):
             self.s = np.asarray(self.s)
+
+        # Build a finer density sampling for density cut-off energies larger than four times ecut
+        self.s_dens = None
+        if self.ecut is not None and self.dual > 4:
+            s_dens = np.int_(self.a / cutoff2gridspacing(self.dual / 4 * self.ecut))
+            s_dens = np.array([next_fast_len(i) for i in 2 * s_dens + 1])
+            if np.any(s_dens > self.s):
+                self.s_dens = np.maximum(s_dens, self.s)
         return
 
     def _set_states(self, Nspin):
@@ -330,18 +380,102 @@ class Atoms:
         G2 = norm(G, axis=1)**2
         self.G2 = G2
 
-        # Calculate the G2 restriction
+        # Real-valued fields have Hermitian-symmetric spectra, i.e., F(-G) = F(G)^*
+        # Real-to-complex FFTs only calculate the non-negative frequencies along the last axis
+        idx = np.arange(np.prod(self.s)).reshape(self.s)
+        self.half = idx[:, :, :self.s[2] // 2 + 1].ravel()
+        # Map every index to the index of its negated frequency, i.e., -k with periodic wrapping
+        self.neg = np.roll(idx[::-1, ::-1, ::-1], 1, axis=(0, 1, 2)).ravel()
+
+        # Calculate the G2 restriction as flat indices, that are faster to use than masks
         if self.ecut is not None:
-            active = np.nonzero(G2 <= 2 * self.ecut)
+            active = np.nonzero(G2 <= 2 * self.ecut)[0]
+        else:
+            active = np.arange(len(G2))
+        if self.gamma:
+            active = self._set_gamma(active)
         else:
-            active = np.nonzero(G2 >= 0)  # Trivial condition to produce the right shape
+            self.gamma_idx = None
+            self.gamma_w = None
         self.active = active
         self.G2c = G2[active]
+        # Buffers depend on the sampling and the active space, reset them
+        self.workspace = {}
+        if self.prune and not self.gamma and len(active) < len(G2):
+            self._set_pencils()
+        else:
+            self.pencils = None
+
+        if self.s_dens is not None:
+            self._set_dens_idx()
 
         # Calculate the structure factor per atom
         self.Sf = np.exp(1j * G @ self.X.T).T
         return
 
+    def _set_pencils(self):
+        '''Build the indices of the non-zero pencils and planes of the active space for pruned FFTs.
+
+        The FFT grid will be transformed axis by axis, starting with the pencils along the last axis
+        that contain active G-vectors, followed by the planes along the first axis that contain
+        these pencils, and a full transformation along the first axis.
+        '''
+        s = self.s
+        i0, i1, i2 = np.unravel_index(self.active, s)
+        # Pencils along the last axis that contain active G-vectors, indexed by (i0, i1)
+        pencils, pencil_idx = np.unique(i0 * s[1] + i1, return_inverse=True)
+        # Planes along the first axis that contain these pencils, indexed by i0
+        planes = np.unique(pencils // s[1])
+        # Index of every active G-vector in the flattened array of pencils
+        active = pencil_idx * s[2] + i2
+        # Index of every pencil in the flattened array of planes
+        pencils = np.searchsorted(planes, pencils // s[1]) * s[1] + pencils % s[1]
+        self.pencils = (active, pencils, planes)
+        return
+
+    def _set_gamma(self, active):
+        '''Restrict the active space to one G-vector of every pair G and -G for real wave functions.
+
+        The kept G-vectors lie in the half spectrum of real-to-complex FFTs. In the planes of the
+        last axis that contain their own negated frequencies, i.e., the zero and Nyquist planes,
+        the partner coefficients have to be written explicitly before the transformation.
+
+        Args:
+            active (ndarray): Indices of the active G-vectors.
+
+        Returns:
+            ndarray: Indices of the kept active G-vectors.
+        '''
+        s = self.s
+        s2 = s[2] // 2 + 1
+        i0, i1, i2 = np.unravel_index(active, s)
+        # Both members of a pair lie in the same plane if the negated last index maps onto itself
+        plane = (i2 == (s[2] - i2) % s[2])
+        keep = (i2 < s2) & (~plane | (active <= self.neg[active]))
+        active = active[keep]
+        i0, i1, i2 = i0[keep], i1[keep], i2[keep]
+        # Position of every kept G-vector in the flattened half spectrum
+        pos = (i0 * s[1] + i1) * s2 + i2
+        # Partners that are part of the half spectrum as well, self-conjugated ones are excluded
+        self_conj = active == self.neg[active]
+        partner = np.nonzero(plane[keep] & ~self_conj)[0]
+        n0, n1, n2 = np.unravel_index(self.neg[active[partner]], s)
+        neg_pos = (n0 * s[1] + n1) * s2 + n2
+        self.gamma_idx = (pos, neg_pos, partner, np.nonzero(self_conj)[0])
+        # Every kept coefficient also represents its partner, except for self-conjugated ones
+        self.gamma_w = np.where(self_conj, 1, 2)
+        return active
+
+    def _set_dens_idx(self):
+        '''Map the frequencies of the sampling to the density sampling.'''
+        freqs = [np.fft.fftfreq(i, 1 / i).astype(int) for i in self.s]
+        f = np.stack([i.ravel() for i in np.meshgrid(*freqs, indexing='ij')])
+        # Exclude Nyquist frequencies, since they have no negated counterpart in even samplings
+        mask = np.all(2 * np.abs(f) < self.s[:, None], axis=0)
+        idx_dens = np.ravel_multi_index(f[:, mask], self.s_dens, mode='wrap')
+        self.dens_idx = (np.nonzero(mask)[0], idx_dens)
+        return
+
     def __repr__(self):
         '''Print the parameters stored in the Atoms object.'''
         out = 'Atom\tCharge\tPosition'
@@ -386,9 +520,13 @@ class Atoms:
         '''Conj transformation from real to reciprocal space :func:`~eminus.operators.Idag`.'''
         return Idag(self, inp, full)
 
-    def Jdag(self, inp):
+    def Jdag(self, inp, real=False):
         '''Conj transformation from reciprocal to real-space :func:`~eminus.operators.Jdag`.'''
-        return Jdag(self, inp)
+        return Jdag(self, inp, real)
+
+    def dot(self, inp, inp2):
+        '''Overlap of wave functions in reciprocal space :func:`~eminus.operators.dot`.'''
+        return dot(self, inp, inp2)
 
     def K(self, inp):
         '''Preconditioning operator :func:`~eminus.operators.K`.'''
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 '''Main DFT functions based on the DFT++ formulation.'''
+import functools
+
 import numpy as np
 from numpy.random import Generator, SFC64
-from scipy.linalg import eig, eigh, eigvalsh, inv, norm, sqrtm
+from scipy.linalg import cholesky, eigh, eigvalsh, norm, solve_triangular
 
-from .gth import calc_Vnonloc
+from .gth import calc_Vnonloc, calc_Vnonloc_rs
+from .operators import interpolate, project_gamma, restrict
 from .utils import diagprod, handle_spin_gracefully, pseudo_uniform
 from .xc import get_xc
 
@@ -25,7 +28,44 @@ def solve_poisson(atoms, n):
     return -4 * np.pi * atoms.Linv(atoms.O(atoms.J(n)))
 
 
-def get_n_total(atoms, Y):
+def get_n(atoms, Y, Yrs=None, func=None):
+    '''Calculate the total electronic density and the densities per spin channel at once.
+
+    The states will be transformed in blocks of atoms.Nblock states to limit the memory usage.
+
+    Args:
+        atoms: Atoms object.
+        Y (ndarray): Expansion coefficients of orthogonal wave functions in reciprocal space.
+
+    Keyword Args:
+        Yrs (ndarray): Real-space orthogonal wave functions, e.g., to reuse a transformation.
+        func (Callable): Function called with the spin, the slice of states, and the real-space
+            wave functions of every block, e.g., to reuse the transformations.
+
+    Returns:
+        tuple[ndarray, ndarray]: Electronic density and electronic densities per spin.
+    '''
+    # Only use the occupied spin channels, e.g., RSCF objects can hold wave functions of two spins
+    if Yrs is not None:
+        Yrs = Yrs[:atoms.Nspin]
+        # n_spin = \sum_i f_i |Y_i|^2 for every spin
+        n_spin = np.einsum('srj,sj->sr', Yrs.real**2 + Yrs.imag**2, atoms.f)
+        return np.sum(n_spin, axis=0), n_spin
+
+    Nstate = Y.shape[-1]
+    Nblock = Nstate if atoms.Nblock is None else atoms.Nblock
+    n_spin = np.zeros((atoms.Nspin, len(atoms.r)))
+    for spin in range(atoms.Nspin):
+        for i in range(0, Nstate, Nblock):
+            states = slice(i, i + Nblock)
+            Yrs = atoms.I(Y[spin][:, states])
+            if func is not None:
+                func(spin, states, Yrs)
+            n_spin[spin] += (Yrs.real**2 + Yrs.imag**2) @ atoms.f[spin, states]
+    return np.sum(n_spin, axis=0), n_spin
+
+
+def get_n_total(atoms, Y, Yrs=None):
     '''Calculate the total electronic density.
 
     Reference: Comput. Phys. Commun. 128, 1.
@@ -34,18 +74,17 @@ def get_n_total(atoms, Y):
         atoms: Atoms object.
         Y (ndarray): Expansion coefficients of orthogonal wave functions in reciprocal space.
 
+    Keyword Args:
+        Yrs (ndarray): Real-space orthogonal wave functions, e.g., to reuse a transformation.
+
     Returns:
         ndarray: Electronic density.
     '''
     # n = (IW) F (IW)dag
-    Yrs = atoms.I(Y)
-    n = np.zeros(len(atoms.r))
-    for spin in range(atoms.Nspin):
-        n += np.sum(atoms.f[spin] * np.real(Yrs[spin].conj() * Yrs[spin]), axis=1)
-    return n
+    return get_n(atoms, Y, Yrs)[0]
 
 
-def get_n_spin(atoms, Y, n=None):
+def get_n_spin(atoms, Y, n=None, Yrs=None):
     '''Calculate the electronic density per spin channel.
 
     Reference: Comput. Phys. Commun. 128, 1.
@@ -56,6 +95,7 @@ def get_n_spin(atoms, Y, n=None):
 
     Keyword Args:
         n (ndarray): Real-space electronic density.
+        Yrs (ndarray): Real-space orthogonal wave functions, e.g., to reuse a transformation.
 
     Returns:
         ndarray: Electronic density per spin.
@@ -63,33 +103,145 @@ def get_n_spin(atoms, Y, n=None):
     # Return the total density in the spin-paired case
     if n is not None and atoms.Nspin == 1:
         return np.atleast_2d(n)
-
-    Yrs = atoms.I(Y)
-    n = np.empty((atoms.Nspin, len(atoms.r)))
-    for spin in range(atoms.Nspin):
-        n[spin] = np.sum(atoms.f[spin] * np.real(Yrs[spin].conj() * Yrs[spin]), axis=1)
-    return n
+    return get_n(atoms, Y, Yrs)[1]
 
 
-def get_n_single(atoms, Y):
+def get_n_single(atoms, Y, Yrs=None):
     '''Calculate the single-electron densities.
 
     Args:
         atoms: Atoms object.
         Y (ndarray): Expansion coefficients of orthogonal wave functions in reciprocal space.
 
+    Keyword Args:
+        Yrs (ndarray): Real-space orthogonal wave functions, e.g., to reuse a transformation.
+
     Returns:
         ndarray: Single-electron densities.
     '''
-    Yrs = atoms.I(Y)
-    n = np.empty((atoms.Nspin, len(atoms.r), atoms.Nstate))
-    for spin in range(atoms.Nspin):
-        n[spin] = atoms.f[spin] * np.real(Yrs[spin].conj() * Yrs[spin])
-    return n
+    if Yrs is None:
+        Yrs = atoms.I(Y[:atoms.Nspin])
+    Yrs = Yrs[:atoms.Nspin]
+    return atoms.f[:, None, :] * (Yrs.real**2 + Yrs.imag**2)
+
+
+def get_xc_dens(atoms, xc, n_spin, Nspin):
+    '''Evaluate the exchange-correlation functional on the density sampling.
+
+    The densities will be interpolated to the density sampling and the resulting energy density and
+    potential will be restricted to the sampling of the wave functions. Without a separate density
+    sampling the functional will be evaluated on the sampling directly.
+
+    Args:
+        atoms: Atoms object.
+        xc (str): Exchange and correlation identifier, separated by a comma.
+        n_spin (ndarray): Real-space electronic densities per spin channel.
+        Nspin (int): Number of spin states.
+
+    Returns:
+        tuple[ndarray, ndarray]: Exchange-correlation energy density and potential.
+    '''
+    if atoms.s_dens is None:
+        return get_xc(xc, n_spin, Nspin)
+    # Interpolated densities can become slightly negative in regions with almost no density
+    n_dens = np.maximum(interpolate(atoms, n_spin), 0)
+    exc, vxc = get_xc(xc, n_dens, Nspin)
+    return restrict(atoms, exc), restrict(atoms, vxc)
+
+
+class Overlap:
+    '''Overlap U = Wdag O(W) of wave functions of one spin channel and its factorizations.
+
+    U is Hermitian and positive definite, so one eigendecomposition is enough to build U^-1 and
+    U^-0.5. The factorizations will only be calculated when needed and reused afterwards, e.g., by
+    orth, get_grad, and Q.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients of unconstrained wave functions in reciprocal space.
+    '''
+    def __init__(self, atoms, W):
+        self.W = W                     # Wave functions
+        self.OW = atoms.O(W)           # Overlap operator applied on W
+        self.U = atoms.dot(W, self.OW)  # Overlap matrix
+        self._mu = None                # Eigenvalues of U
+        self._V = None                 # Eigenvectors of U
+        self._U12 = None               # U^-0.5
+        self._invU = None              # U^-1
+
+    @property
+    def mu(self):
+        '''Eigenvalues of U.'''
+        if self._mu is None:
+            self._mu, self._V = eigh(self.U)
+        return self._mu
+
+    @property
+    def V(self):
+        '''Eigenvectors of U.'''
+        if self._V is None:
+            self._mu, self._V = eigh(self.U)
+        return self._V
+
+    @property
+    def U12(self):
+        '''Inverse square root U^-0.5.'''
+        if self._U12 is None:
+            self._U12 = (self.V / np.sqrt(self.mu)) @ self.V.conj().T
+        return self._U12
+
+    @property
+    def invU(self):
+        '''Inverse U^-1.'''
+        if self._invU is None:
+            self._invU = (self.V / self.mu) @ self.V.conj().T
+        return self._invU
+
+    def orth(self, method='lowdin'):
+        '''Orthogonalize W.
+
+        Keyword Args:
+            method (str): Orthogonalization method, i.e., 'lowdin' or 'cholesky'.
+
+        Returns:
+            ndarray: Orthogonalized wave functions.
+        '''
+        if method == 'cholesky':
+            # Y = W L^-dag with U = L Ldag, solved for Y^T to keep W untouched
+            L = cholesky(self.U, lower=True)
+            Y = solve_triangular(L.conj(), self.W.T, lower=True).T
+        else:
+            # Y = W U^-0.5
+            Y = self.W @ self.U12
+        # Keep the precision of W, e.g., for single precision calculations
+        return Y.astype(self.W.dtype, copy=False)
+
+
+def get_overlap(scf, spin, W, Y=None):
+    '''Get the overlap of W, reusing the overlap of the current SCF step if possible.
+
+    The overlaps will be calculated in every SCF step together with scf.Y. Like the other
+    intermediate results they will only be reused if scf.W and scf.Y are passed, since the
+    minimizers update scf.W in-place.
+
+    Args:
+        scf: SCF object.
+        spin (int): Spin variable to track weather to calculate the overlap for spin up or down.
+        W (ndarray): Expansion coefficients of unconstrained wave functions in reciprocal space.
+
+    Keyword Args:
+        Y (ndarray): Expansion coefficients of orthogonal wave functions in reciprocal space.
+
+    Returns:
+        Overlap: Overlap of W for the given spin.
+    '''
+    if W is scf.W and Y is scf.Y and scf.U is not None:
+        return scf.U[spin]
+    return Overlap(scf.atoms, W[spin])
 
 
 @handle_spin_gracefully
-def orth(atoms, W):
+def orth(atoms, W, method='lowdin'):
     '''Orthogonalize coefficient matrix W.
 
     Reference: Comput. Phys. Commun. 128, 1.
@@ -98,11 +250,15 @@ def orth(atoms, W):
         atoms: Atoms object.
         W (ndarray): Expansion coefficients of unconstrained wave functions in reciprocal space.
 
+    Keyword Args:
+        method (str): Orthogonalization method, i.e., 'lowdin' for the symmetric orthogonalization
+            or 'cholesky' for a Cholesky decomposition of the overlap.
+
     Returns:
         ndarray: Orthogonalized wave functions.
     '''
     # Y = W (Wdag O(W))^-0.5
-    return W @ inv(sqrtm(W.conj().T @ atoms.O(W)))
+    return Overlap(atoms, W).orth(method)
 
 
 def get_grad(scf, spin, W, Y=None, n=None, phi=None, vxc=None):
@@ -127,16 +283,15 @@ def get_grad(scf, spin, W, Y=None, n=None, phi=None, vxc=None):
     atoms = scf.atoms
     F = np.diag(atoms.f[spin])
     HW = H(scf, spin, W, Y, n, phi, vxc)
-    WHW = W[spin].conj().T @ HW
+    WHW = atoms.dot(W[spin], HW)
     # U = Wdag O(W)
-    U = W[spin].conj().T @ atoms.O(W[spin])
-    invU = inv(U)
-    U12 = sqrtm(invU)
+    U = get_overlap(scf, spin, W, Y)
+    U12 = U.U12
     # Htilde = U^-0.5 Wdag H(W) U^-0.5
     Ht = U12 @ WHW @ U12
     # grad E = H(W) - O(W) U^-1 (Wdag H(W)) (U^-0.5 F U^-0.5) + O(W) (U^-0.5 Q(Htilde F - F Htilde))
-    return (HW - (atoms.O(W[spin]) @ invU) @ WHW) @ (U12 @ F @ U12) + \
-        atoms.O(W[spin]) @ (U12 @ Q(Ht @ F - F @ Ht, U))
+    grad = (HW - (U.OW @ U.invU) @ WHW) @ (U12 @ F @ U12) + U.OW @ (U12 @ Q(Ht @ F - F @ Ht, U))
+    return project_gamma(atoms, grad)
 
 
 def H(scf, spin, W, Y=None, n=None, phi=None, vxc=None):
@@ -162,25 +317,325 @@ def H(scf, spin, W, Y=None, n=None, phi=None, vxc=None):
     # One can calculate everything from W,
     # but one can also use already computed results to save time
     if Y is None:
-        Y = orth(atoms, W)
+        Y = orth(atoms, W, scf.orth)
+    n_spin = None
     if n is None:
-        n = get_n_total(atoms, Y)
+        # Calculate both densities with one transformation
+        n, n_spin = get_n(atoms, Y)
     if phi is None:
         phi = solve_poisson(atoms, n)
     if vxc is None:
-        n_spin = get_n_spin(atoms, Y, n)
-        vxc = get_xc(scf.xc, n_spin, atoms.Nspin)[1]
+        if n_spin is None:
+            n_spin = get_n_spin(atoms, Y, n)
+        vxc = get_xc_dens(atoms, scf.xc, n_spin, atoms.Nspin)[1]
+
+    # Reuse the effective potential of the current SCF step if possible
+    if phi is scf.phi and vxc is scf.vxc and scf.Veff is not None:
+        Veff = scf.Veff[spin]
+    else:
+        Veff = get_Veff(scf, phi, vxc[spin:spin + 1])[0]
+    return apply_H(scf, Veff, W[spin])
+
+
+def apply_H(scf, Veff, W):
+    '''Apply the Hamiltonian with a given effective potential on W.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+        W (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
 
+    Returns:
+        ndarray: Hamiltonian applied on W.
+    '''
+    atoms = scf.atoms
+    # Vkin = -0.5 L(W)
+    Vkin_psi = -0.5 * atoms.L(W)
+    # Real-space projectors will be applied together with the local potential
+    if scf.betaNL_rs is not None:
+        return Vkin_psi + apply_Vloc(atoms, Veff, W, functools.partial(calc_Vnonloc_rs, scf))
+    Vnonloc_psi = calc_Vnonloc(scf, W)
+    # H = Vkin + Idag(diag(Veff))I + Vnonloc
+    return Vkin_psi + apply_Vloc(atoms, Veff, W) + Vnonloc_psi
+
+
+def get_Veff(scf, phi, vxc):
+    '''Calculate the effective potential per spin channel.
+
+    Args:
+        scf: SCF object.
+        phi (ndarray): Hartree field.
+        vxc (ndarray): Exchange-correlation potential.
+
+    Returns:
+        ndarray: Effective potential per spin.
+    '''
+    atoms = scf.atoms
     # We get the full potential in the functional definition (different to the DFT++ notation)
     # Normally Vxc = Jdag(O(J(exc))) + diag(exc') Jdag(O(J(n)))
-    Vxc = atoms.Jdag(atoms.O(atoms.J(vxc[spin])))
-    # Vkin = -0.5 L(W)
-    Vkin_psi = -0.5 * atoms.L(W[spin])
+    # Transform the potentials of all spins at once by handling them as states
+    Vxc = atoms.Jdag(atoms.O(atoms.J(vxc.T)), True)
     # Veff = Jdag(Vion) + Jdag(O(J(vxc))) + Jdag(O(phi))
-    Veff = scf.Vloc + Vxc + atoms.Jdag(atoms.O(phi))
-    Vnonloc_psi = calc_Vnonloc(scf, W[spin])
-    # H = Vkin + Idag(diag(Veff))I + Vnonloc
-    return Vkin_psi + atoms.Idag(diagprod(Veff, atoms.I(W[spin]))) + Vnonloc_psi
+    return (Vxc + (scf.Vloc + atoms.Jdag(atoms.O(phi), True))[:, None]).T
+
+
+def apply_Vloc(atoms, V, W, Vrs=None):
+    '''Apply a local potential on W in blocks of states.
+
+    Every block will be transformed to real-space, multiplied with the potential, and transformed
+    back into a preallocated output, such that only one block lives in real-space at a time.
+
+    Args:
+        atoms: Atoms object.
+        V (ndarray): Real-space potential.
+        W (ndarray): Expansion coefficients of wave functions in reciprocal space.
+
+    Keyword Args:
+        Vrs (Callable | None): Additional operator acting on real-space wave functions, e.g., the
+            non-local potential with real-space projectors. It will be called with the real-space
+            wave functions and the real-space result, that it has to update in-place.
+
+    Returns:
+        ndarray: Idag(diag(V))I applied on W.
+    '''
+    # Use the precision of W, e.g., for single precision calculations
+    V = V.astype(W.real.dtype, copy=False)
+
+    def apply(W):
+        Wrs = atoms.I(W)
+        VWrs = diagprod(V, Wrs)
+        if Vrs is not None:
+            Vrs(Wrs, VWrs)
+        return atoms.Idag(VWrs)
+
+    Nblock = atoms.Nblock
+    if Nblock is None or Nblock >= W.shape[1]:
+        return apply(W)
+
+    VW = np.empty(W.shape, dtype=np.result_type(W.dtype, np.complex64))
+    for i in range(0, W.shape[1], Nblock):
+        VW[:, i:i + Nblock] = apply(W[:, i:i + Nblock])
+    return VW
+
+
+def davidson(scf, Veff, W, Nit=3):
+    '''Calculate the lowest eigenstates of H for a fixed effective potential.
+
+    A block Davidson method that is restarted in every iteration, i.e., the Rayleigh-Ritz step is
+    done in the space of the current eigenstates and their preconditioned residuals.
+
+    Reference: J. Comput. Phys. 17, 87.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+        W (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
+
+    Keyword Args:
+        Nit (int): Number of iterations.
+
+    Returns:
+        tuple[ndarray, ndarray]: Eigenvalues and orthogonal eigenstates.
+    '''
+    atoms = scf.atoms
+    Y = orth(atoms, W)
+    HY = apply_H(scf, Veff, Y)
+    eps = np.real(np.diag(atoms.dot(Y, HY)))
+    for _ in range(Nit):
+        # R = H(Y) - O(Y) (Ydag H(Y))
+        R = HY - atoms.O(Y) @ atoms.dot(Y, HY)
+        # Expand the space with the preconditioned residuals, orthogonal to Y
+        P = _orth_against(atoms, Y, atoms.K(R))[0]
+        S = np.hstack((Y, P))
+        HS = np.hstack((HY, apply_H(scf, Veff, P)))
+        eps, Y, HY = _rayleigh_ritz(atoms, S, HS, Y.shape[1])
+    return eps, Y
+
+
+def lobpcg(scf, Veff, W, Nit=100, tol=1e-5):
+    '''Calculate the lowest eigenstates of H for a fixed effective potential.
+
+    Locally optimal block preconditioned conjugate-gradient method, using the K preconditioner. The
+    number of calculated eigenstates is given by the number of states in W, so it can be larger
+    than the number of occupied states.
+
+    Reference: SIAM J. Sci. Comput. 23, 517.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+        W (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
+
+    Keyword Args:
+        Nit (int): Maximum number of iterations.
+        tol (float): Convergence tolerance of the residual norms per state.
+
+    Returns:
+        tuple[ndarray, ndarray]: Eigenvalues and orthogonal eigenstates.
+    '''
+    atoms = scf.atoms
+    Nstate = W.shape[1]
+    Y = orth(atoms, W)
+    eps, Y, HY = _rayleigh_ritz(atoms, Y, apply_H(scf, Veff, Y), Nstate)
+    P = HP = np.empty((len(Y), 0), dtype=Y.dtype)
+    for _ in range(Nit):
+        # R = H(Y) - O(Y) diag(eps), the residual norms are scaled to be in units of energy
+        R = HY - atoms.O(Y) * eps
+        if np.max(norm(R, axis=0)) / np.sqrt(atoms.Omega) < tol:
+            break
+        # Build the search space from the preconditioned residuals and the previous directions
+        KR = atoms.K(R)
+        Z, C, T = _orth_against(atoms, Y, np.hstack((KR, P)))
+        # H is only applied on the residuals, H(P) is known from the last iteration
+        HZ = (np.hstack((apply_H(scf, Veff, KR), HP)) - HY @ C) @ T
+        S = np.hstack((Y, Z))
+        HS = np.hstack((HY, HZ))
+        eps, Ynew, HYnew, C = _rayleigh_ritz(atoms, S, HS, Nstate, coeffs=True)
+        # The new directions are the parts of the new eigenstates outside of the old ones
+        P = Z @ C[Nstate:]
+        HP = HZ @ C[Nstate:]
+        Y, HY = Ynew, HYnew
+    else:
+        scf.log.warning('Eigensolver not converged!')
+    return eps, Y
+
+
+def rayleigh_ritz(scf, Veff, W):
+    '''Calculate approximate eigenstates of H in the space of the wave functions W.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+        W (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
+
+    Returns:
+        tuple[ndarray, ndarray]: Eigenvalues and orthogonal eigenstates.
+    '''
+    atoms = scf.atoms
+    Y = orth(atoms, W)
+    eps, Y, _ = _rayleigh_ritz(atoms, Y, apply_H(scf, Veff, Y), Y.shape[1])
+    return eps, Y
+
+
+def chebyshev_filter(scf, Veff, W, degree, lowest, lower, upper):
+    '''Apply a Chebyshev polynomial filter of H on wave functions for a fixed effective potential.
+
+    The polynomial is scaled such that the eigenstates in [lower, upper] are damped, while the
+    eigenstates below lower are amplified relative to them. The scaling keeps the norm of the
+    eigenstate at lowest around one.
+
+    Reference: J. Comput. Phys. 219, 172.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+        W (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
+        degree (int): Degree of the Chebyshev polynomial.
+        lowest (float): Estimate of the lowest eigenvalue.
+        lower (float): Lower bound of the damped interval.
+        upper (float): Upper bound of the spectrum.
+
+    Returns:
+        ndarray: Filtered wave functions.
+    '''
+    atoms = scf.atoms
+
+    def shift(X):
+        # HY = Omega Y eps for Y^H O Y = I, so apply_H / Omega has the eigenvalues eps
+        return apply_H(scf, Veff, X) / atoms.Omega - center * X
+
+    e = (upper - lower) / 2
+    center = (upper + lower) / 2
+    sigma = e / (lowest - center)
+    tau = 2 / sigma
+    X0 = W
+    X1 = shift(W) * (sigma / e)
+    for _ in range(1, degree):
+        sigma_new = 1 / (tau - sigma)
+        X0, X1 = X1, shift(X1) * (2 * sigma_new / e) - X0 * (sigma * sigma_new)
+        sigma = sigma_new
+    return X1
+
+
+def get_upper_bound(scf, Veff, Nit=8):
+    '''Estimate an upper bound of the spectrum of H with a few Lanczos steps.
+
+    Reference: Linear Algebra Appl. 435, 480.
+
+    Args:
+        scf: SCF object.
+        Veff (ndarray): Real-space effective potential.
+
+    Keyword Args:
+        Nit (int): Number of Lanczos steps.
+
+    Returns:
+        float: Upper bound of the eigenvalues.
+    '''
+    atoms = scf.atoms
+    rng = Generator(SFC64(42))
+    v = rng.standard_normal((len(atoms.G2c), 1)) + 1j * rng.standard_normal((len(atoms.G2c), 1))
+    project_gamma(atoms, v)
+    v /= np.sqrt(np.real(atoms.dot(v, v)))
+    f = apply_H(scf, Veff, v) / atoms.Omega
+    alpha = np.real(atoms.dot(v, f))[0, 0]
+    f -= alpha * v
+    T = np.zeros((Nit, Nit))
+    T[0, 0] = alpha
+    for i in range(1, Nit):
+        beta = np.sqrt(np.real(atoms.dot(f, f)))[0, 0]
+        v0, v = v, f / beta
+        f = apply_H(scf, Veff, v) / atoms.Omega - beta * v0
+        alpha = np.real(atoms.dot(v, f))[0, 0]
+        f -= alpha * v
+        T[i, i] = alpha
+        T[i - 1, i] = T[i, i - 1] = beta
+    return eigvalsh(T)[-1] + np.sqrt(np.real(atoms.dot(f, f)))[0, 0]
+
+
+def _orth_against(atoms, Y, Z):
+    '''Orthogonalize Z against orthogonal wave functions Y and orthogonalize Z afterwards.
+
+    Linearly dependent directions of Z will be removed.
+
+    Args:
+        atoms: Atoms object.
+        Y (ndarray): Orthogonal wave functions.
+        Z (ndarray): Wave functions.
+
+    Returns:
+        tuple[ndarray, ndarray, ndarray]: Orthogonal wave functions, the projection coefficients on
+        Y, and the transformation applied after the projection.
+    '''
+    C = atoms.dot(Y, atoms.O(Z))
+    Z = Z - Y @ C
+    mu, V = eigh(atoms.dot(Z, atoms.O(Z)))
+    keep = mu > 1e-12 * np.max(mu)
+    T = V[:, keep] / np.sqrt(mu[keep])
+    return Z @ T, C, T
+
+
+def _rayleigh_ritz(atoms, S, HS, Nstate, coeffs=False):
+    '''Calculate the lowest eigenstates of H in the space of orthogonal wave functions S.
+
+    Args:
+        atoms: Atoms object.
+        S (ndarray): Orthogonal wave functions.
+        HS (ndarray): Hamiltonian applied on S.
+        Nstate (int): Number of eigenstates.
+
+    Keyword Args:
+        coeffs (bool): Also return the expansion coefficients of the eigenstates in S.
+
+    Returns:
+        tuple[ndarray, ndarray, ndarray]: Eigenvalues, eigenstates, and H applied on them.
+    '''
+    mu = atoms.dot(S, HS)
+    eps, D = eigh(0.5 * (mu + mu.conj().T))
+    eps, D = eps[:Nstate], D[:, :Nstate]
+    if coeffs:
+        return eps, S @ D, HS @ D, D
+    return eps, S @ D, HS @ D
 
 
 def Q(inp, U):
@@ -190,19 +645,19 @@ def Q(inp, U):
 
     Args:
         inp (ndarray): Coefficients input array.
-        U (ndarray): Overlap of wave functions.
+        U (Overlap): Overlap of wave functions.
 
     Returns:
         ndarray: Q operator result.
     '''
-    mu, V = eig(U)
+    mu, V = U.mu, U.V
     mu = mu[:, None]
     denom = np.sqrt(mu) @ np.ones((1, len(mu)))
     denom2 = denom + denom.conj().T
     return V @ ((V.conj().T @ inp @ V) / denom2) @ V.conj().T
 
 
-def get_psi(scf, W, n=None):
+def get_psi(scf, W, n=None, Nstate=None):
     '''Calculate eigenstates from H.
 
     Reference: Comput. Phys. Commun. 128, 1.
@@ -213,21 +668,25 @@ def get_psi(scf, W, n=None):
 
     Keyword Args:
         n (ndarray): Real-space electronic density.
+        Nstate (int | None): Number of eigenstates. Additional states, e.g., unoccupied ones, will
+            be calculated with an iterative eigensolver in the potential of W.
 
     Returns:
         ndarray: Eigenstates in reciprocal space.
     '''
     atoms = scf.atoms
-    Y = orth(atoms, W)
+    if Nstate is not None and Nstate > W.shape[-1]:
+        return _get_eigenstates(scf, W, n, Nstate)[1]
+    Y = orth(atoms, W, scf.orth)
     psi = np.empty_like(Y)
     for spin in range(atoms.Nspin):
-        mu = Y[spin].conj().T @ H(scf, spin, W=Y, n=n)
+        mu = atoms.dot(Y[spin], H(scf, spin, W=Y, n=n))
         _, D = eigh(mu)
         psi[spin] = Y[spin] @ D
     return psi
 
 
-def get_epsilon(scf, W, n=None):
+def get_epsilon(scf, W, n=None, Nstate=None):
     '''Calculate eigenvalues from H.
 
     Reference: Comput. Phys. Commun. 128, 1.
@@ -238,19 +697,60 @@ def get_epsilon(scf, W, n=None):
 
     Keyword Args:
         n (ndarray): Real-space electronic density.
+        Nstate (int | None): Number of eigenvalues. Additional states, e.g., unoccupied ones, will
+            be calculated with an iterative eigensolver in the potential of W.
 
     Returns:
         ndarray: Eigenvalues.
     '''
     atoms = scf.atoms
-    Y = orth(atoms, W)
+    if Nstate is not None and Nstate > W.shape[-1]:
+        return _get_eigenstates(scf, W, n, Nstate)[0]
+    Y = orth(atoms, W, scf.orth)
     epsilon = np.empty((atoms.Nspin, atoms.Nstate))
     for spin in range(atoms.Nspin):
-        mu = Y[spin].conj().T @ H(scf, spin, W=Y, n=n)
+        mu = atoms.dot(Y[spin], H(scf, spin, W=Y, n=n))
         epsilon[spin] = np.sort(eigvalsh(mu))
     return epsilon
 
 
+def _get_eigenstates(scf, W, n, Nstate):
+    '''Calculate the lowest eigenstates of H in the potential of W with the LOBPCG eigensolver.
+
+    Args:
+        scf: SCF object.
+        W (ndarray): Expansion coefficients of unconstrained wave functions in reciprocal space.
+        n (ndarray | None): Real-space electronic density.
+        Nstate (int): Number of eigenstates.
+
+    Returns:
+        tuple[ndarray, ndarray]: Eigenvalues and eigenstates in reciprocal space.
+    '''
+    atoms = scf.atoms
+    Y = orth(atoms, W, scf.orth)
+    # The Hamiltonian is fixed by the density of W
+    if n is None:
+        n, n_spin = get_n(atoms, Y)
+    else:
+        n_spin = get_n_spin(atoms, Y, n)
+    phi = solve_poisson(atoms, n)
+    vxc = get_xc_dens(atoms, scf.xc, n_spin, atoms.Nspin)[1]
+    Veff = get_Veff(scf, phi, vxc)
+
+    # Start from the given states and add smooth random states
+    rng = Generator(SFC64(42))
+    Nextra = Nstate - Y.shape[-1]
+    epsilon = np.empty((atoms.Nspin, Nstate))
+    psi = np.empty((atoms.Nspin, len(atoms.G2c), Nstate), dtype=complex)
+    for spin in range(atoms.Nspin):
+        Wextra = rng.standard_normal((len(atoms.G2c), Nextra)) + \
+            1j * rng.standard_normal((len(atoms.G2c), Nextra))
+        project_gamma(atoms, Wextra)
+        Wspin = np.hstack((Y[spin], atoms.K(Wextra)))
+        epsilon[spin], psi[spin] = lobpcg(scf, Veff[spin], Wspin)
+    return epsilon, psi
+
+
 def guess_random(scf, complex=True):
     '''Generate random initial-guess coefficients as starting values.
 
@@ -272,7 +772,7 @@ def guess_random(scf, complex=True):
             1j * rng.standard_normal((atoms.Nspin, len(atoms.G2c), atoms.Nstate))
     else:
         W = rng.standard_normal((atoms.Nspin, len(atoms.G2c), atoms.Nstate))
-    return orth(atoms, W)
+    return orth(atoms, project_gamma(atoms, W))
 
 
 def guess_gaussian(scf, complex=True):
@@ -316,4 +816,4 @@ def guess_pseudo(scf, seed=1234):
     '''
     atoms = scf.atoms
     W = pseudo_uniform((atoms.Nspin, len(atoms.G2c), atoms.Nstate), seed=seed)
-    return orth(atoms, W)
+    return orth(atoms, project_gamma(atoms, W))
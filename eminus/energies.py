@@ -2,10 +2,11 @@
 '''Calculate different energy contributions.'''
 import numpy as np
 from scipy.linalg import inv, norm
-from scipy.special import erfc
+from scipy.spatial import cKDTree
+from scipy.special import erfc, erfcinv
 
-from .dft import get_n_single, solve_poisson
-from .xc import get_xc
+from .dft import get_n_single, get_xc_dens, solve_poisson
+from .gth import calc_proj_rs
 
 
 class Energy:
@@ -37,12 +38,15 @@ class Energy:
         return f'{out}{"-" * 25}\nEtot    : {self.Etot:+.9f} Eh'
 
 
-def get_E(scf):
+def get_E(scf, betaNL_psi=None):
     '''Calculate energy contributions and update energies needed in one SCF step.
 
     Args:
         scf: SCF object.
 
+    Keyword Args:
+        betaNL_psi (ndarray): Projections of Y on the projectors per spin, e.g., to reuse them.
+
     Returns:
         float: Total energy.
     '''
@@ -50,7 +54,7 @@ def get_E(scf):
     scf.energies.Ecoul = get_Ecoul(scf.atoms, scf.n, scf.phi)
     scf.energies.Exc = get_Exc(scf, scf.n, scf.exc, scf.atoms.Nspin)
     scf.energies.Eloc = get_Eloc(scf, scf.n)
-    scf.energies.Enonloc = get_Enonloc(scf, scf.Y)
+    scf.energies.Enonloc = get_Enonloc(scf, scf.Y, betaNL_psi)
     return scf.energies.Etot
 
 
@@ -70,7 +74,7 @@ def get_Ekin(atoms, Y):
     Ekin = 0
     for spin in range(atoms.Nspin):
         F = np.diag(atoms.f[spin])
-        Ekin += -0.5 * np.trace(F @ (Y[spin].conj().T @ atoms.L(Y[spin])))
+        Ekin += -0.5 * np.trace(F @ atoms.dot(Y[spin], atoms.L(Y[spin])))
     return np.real(Ekin)
 
 
@@ -92,7 +96,7 @@ def get_Ecoul(atoms, n, phi=None):
     if phi is None:
         phi = solve_poisson(atoms, n)
     # Ecoul = -(J(n))dag O(phi)
-    return np.real(0.5 * n.T @ atoms.Jdag(atoms.O(phi)))
+    return 0.5 * n.T @ atoms.Jdag(atoms.O(phi), True)
 
 
 def get_Exc(scf, n, exc=None, n_spin=None, Nspin=2):
@@ -114,9 +118,9 @@ def get_Exc(scf, n, exc=None, n_spin=None, Nspin=2):
     '''
     atoms = scf.atoms
     if exc is None:
-        exc = get_xc(scf.xc, n_spin, Nspin)[0]
+        exc = get_xc_dens(atoms, scf.xc, n_spin, Nspin)[0]
     # Exc = (J(n))dag O(J(exc))
-    return np.real(n.T @ atoms.Jdag(atoms.O(atoms.J(exc))))
+    return n.T @ atoms.Jdag(atoms.O(atoms.J(exc)), True)
 
 
 def get_Eloc(scf, n):
@@ -135,7 +139,7 @@ def get_Eloc(scf, n):
 
 
 # Adapted from https://github.com/f-fathurrahman/PWDFT.jl/blob/master/src/calc_energies.jl
-def get_Enonloc(scf, Y):
+def get_Enonloc(scf, Y, betaNL_psi=None):
     '''Calculate the non-local GTH energy contribution.
 
     Reference: Phys. Rev. B 54, 1703.
@@ -144,6 +148,9 @@ def get_Enonloc(scf, Y):
         scf: SCF object.
         Y (ndarray): Expansion coefficients of orthogonal wave functions in reciprocal space.
 
+    Keyword Args:
+        betaNL_psi (ndarray): Projections of Y on the projectors per spin, e.g., to reuse them.
+
     Returns:
         float: Non-local GTH energy contribution in Hartree.
     '''
@@ -151,36 +158,59 @@ def get_Enonloc(scf, Y):
 
     Enonloc = 0
     if scf.NbetaNL > 0:  # Only calculate non-local potential if necessary
+        if betaNL_psi is None:
+            betaNL_psi = [get_proj(scf, Y[spin]) for spin in range(atoms.Nspin)]
         for spin in range(atoms.Nspin):
-            betaNL_psi = (Y[spin].conj().T @ scf.betaNL).conj()
-
-            enl = np.zeros(atoms.Nstate, dtype=complex)
-            for ia in range(atoms.Natoms):
-                psp = scf.GTH[atoms.atom[ia]]
-                for l in range(psp['lmax']):
-                    for m in range(-l, l + 1):
-                        for iprj in range(psp['Nproj_l'][l]):
-                            ibeta = scf.prj2beta[iprj, ia, l, m + psp['lmax'] - 1] - 1
-                            for jprj in range(psp['Nproj_l'][l]):
-                                jbeta = scf.prj2beta[jprj, ia, l, m + psp['lmax'] - 1] - 1
-                                hij = psp['h'][l, iprj, jprj]
-                                enl += hij * betaNL_psi[:, ibeta].conj() * betaNL_psi[:, jbeta]
+            # Enonloc = \sum_i f_i (betaNLdag Y_i)dag D (betaNLdag Y_i)
+            enl = np.sum(betaNL_psi[spin].conj() * (scf.D @ betaNL_psi[spin]), axis=0)
             Enonloc += np.sum(atoms.f[spin] * enl)
     # We have to multiply with the cell volume, because of different orthogonalization methods
     return np.real(Enonloc * atoms.Omega)
 
 
-def get_Eewald(atoms, gcut=2, gamma=1e-8):
+def get_proj(scf, Y):
+    '''Calculate the projections of wave functions of one spin on the non-local projectors.
+
+    Real-space projectors will transform the states in blocks of atoms.Nblock states.
+
+    Args:
+        scf: SCF object.
+        Y (ndarray): Expansion coefficients of wave functions of one spin in reciprocal space.
+
+    Returns:
+        ndarray: Projections betaNLdag Y.
+    '''
+    atoms = scf.atoms
+    if scf.betaNL_rs is None:
+        return atoms.dot(scf.betaNL, Y)
+    Nstate = Y.shape[-1]
+    Nblock = Nstate if atoms.Nblock is None else atoms.Nblock
+    return np.hstack([calc_proj_rs(scf, atoms.I(Y[:, i:i + Nblock]))
+                      for i in range(0, Nstate, Nblock)])
+
+
+def get_Eewald(atoms, gcut=None, gamma=1e-8, spme=False, order=8):
     '''Calculate the Ewald energy.
 
+    The real-space sum uses a neighbor list of the periodic images of the atoms, the reciprocal
+    space sum uses one structure factor evaluation for all atoms, or a smooth particle-mesh Ewald
+    (SPME) sum on the real-space sampling of the cell.
+
     Reference: J. Chem. Theory Comput. 10, 381.
 
     Args:
         atoms: Atoms object.
 
     Keyword Args:
-        gcut (float): G-vector cut-off.
-        gamma (float): Error tolerance
+        gcut (float | None): G-vector cut-off, i.e., the radius of the sphere of reciprocal lattice
+            vectors in the reciprocal space sum. The splitting parameter follows from it and the
+            error tolerance.
+
+            None will choose the Ewald splitting parameter such that the work of both sums is
+            balanced, and the cut-offs follow from the error tolerance.
+        gamma (float): Error tolerance of the Ewald energy in Hartree.
+        spme (bool): Calculate the reciprocal space sum with SPME, gcut will be ignored.
+        order (int): Order of the B-splines used by SPME, should be even.
 
     Returns:
         float: Ewald energy in Hartree.
@@ -188,25 +218,7 @@ def get_Eewald(atoms, gcut=2, gamma=1e-8):
     # For a plane wave code we have multiple contributions for the Ewald energy
     # Namely, a sum from contributions from real-space, reciprocal space,
     # the self energy, (the dipole term [neglected]), and an additional electroneutrality term
-    def get_index_vectors(s):
-        '''Create all index vectors of periodic images.
-
-        Args:
-            s (ndarray): Number of images per lattice vector.
-
-        Returns:
-            ndarray: Index matrix.
-        '''
-        m1 = np.arange(-s[0], s[0] + 1)
-        m2 = np.arange(-s[1], s[1] + 1)
-        m3 = np.arange(-s[2], s[2] + 1)
-        M = np.transpose(np.meshgrid(m1, m2, m3)).reshape(-1, 3)
-        # Delete the [0, 0, 0] element, to prevent checking for it in every loop
-        return M[~np.all(M == 0, axis=1)]
-
-    # Calculate the Ewald splitting parameter nu
-    gexp = -np.log(gamma)
-    nu = 0.5 * np.sqrt(gcut**2 / gexp)
+    nu, rcut, gcut = _get_ewald_params(atoms, gcut, gamma, spme)
 
     # Start by calculating the self-energy
     Eewald = -nu / np.sqrt(np.pi) * np.sum(atoms.Z**2)
@@ -214,49 +226,265 @@ def get_Eewald(atoms, gcut=2, gamma=1e-8):
     Eewald += -np.pi * np.sum(atoms.Z)**2 / (2 * nu**2 * atoms.Omega)
 
     # Calculate the real-space contribution
-    # Calculate the amount of images that have to be considered per axis
-    Rm = norm(atoms.R, axis=1)
-    tmax = np.sqrt(0.5 * gexp) / nu
-    s = np.rint(tmax / Rm + 1.5)
-    # Collect all box index vector in a matrix
-    M = get_index_vectors(s)
-    # Calculate the translation vectors
-    T = M @ atoms.R
-
-    for ia in range(atoms.Natoms):
-        for ja in range(atoms.Natoms):
-            dX = atoms.X[ia] - atoms.X[ja]
-            ZiZj = atoms.Z[ia] * atoms.Z[ja]
-            rmag = np.sqrt(norm(dX - T, axis=1)**2)
-            # Add the real-space contribution
-            Eewald += 0.5 * ZiZj * np.sum(erfc(rmag * nu) / rmag)
-            # The T=[0, 0, 0] element is ommited in M but needed if ia!=ja, so add it manually
-            if ia != ja:
-                rmag = np.sqrt(norm(dX)**2)
-                Eewald += 0.5 * ZiZj * erfc(rmag * nu) / rmag
+    i, j, dX = _get_neighbors(atoms, rcut)
+    rmag = norm(dX, axis=1)
+    Eewald += 0.5 * np.sum(atoms.Z[i] * atoms.Z[j] * erfc(rmag * nu) / rmag)
 
     # Calculate the reciprocal space contribution
-    # Calculate the amount of reciprocal images that have to be considered per axis
-    g = 2 * np.pi * inv(atoms.R.T)
-    gm = norm(g, axis=1)
-    s = np.rint(gcut / gm + 1.5)
-    # Collect all box index vector in a matrix
-    M = get_index_vectors(s)
-    # Calculate the reciprocal translation vectors and precompute the prefactor
-    G = M @ g
+    if spme:
+        Eewald += _get_spme(atoms, nu, order)[0]
+        return Eewald
+    G = _get_reciprocal_vectors(atoms, gcut)
     G2 = norm(G, axis=1)**2
     prefactor = 2 * np.pi / atoms.Omega * np.exp(-0.25 * G2 / nu**2) / G2
-
-    for ia in range(atoms.Natoms):
-        for ja in range(atoms.Natoms):
-            dX = atoms.X[ia] - atoms.X[ja]
-            ZiZj = atoms.Z[ia] * atoms.Z[ja]
-            GX = np.sum(G * dX, axis=1)
-            # Add the reciprocal space contribution
-            Eewald += ZiZj * np.sum(prefactor * np.cos(GX))
+    # Structure factor of the ionic charges, Eewald_recip = \sum_G prefactor |S(G)|^2
+    Sf = np.exp(1j * G @ atoms.X.T) @ atoms.Z
+    Eewald += np.sum(prefactor * np.abs(Sf)**2)
     return Eewald
 
 
+def get_Fewald(atoms, gcut=None, gamma=1e-8, spme=False, order=8):
+    '''Calculate the Ewald forces, i.e., the negative gradient of the Ewald energy.
+
+    Args:
+        atoms: Atoms object.
+
+    Keyword Args:
+        gcut (float | None): G-vector cut-off, i.e., the radius of the sphere of reciprocal lattice
+            vectors in the reciprocal space sum. The splitting parameter follows from it and the
+            error tolerance.
+
+            None will choose the Ewald splitting parameter such that the work of both sums is
+            balanced, and the cut-offs follow from the error tolerance.
+        gamma (float): Error tolerance of the Ewald energy in Hartree.
+        spme (bool): Calculate the reciprocal space sum with SPME, gcut will be ignored.
+        order (int): Order of the B-splines used by SPME, should be even.
+
+    Returns:
+        ndarray: Ewald forces in Hartree per Bohr.
+    '''
+    # The self-energy and the electroneutrality term do not depend on the atom positions
+    nu, rcut, gcut = _get_ewald_params(atoms, gcut, gamma, spme)
+
+    # Calculate the real-space contribution
+    i, j, dX = _get_neighbors(atoms, rcut)
+    rmag = norm(dX, axis=1)
+    # -d/dr erfc(nu r) / r = (erfc(nu r) / r + 2 nu / sqrt(pi) exp(-nu^2 r^2)) / r
+    f = atoms.Z[i] * atoms.Z[j] / rmag**2 * \
+        (erfc(rmag * nu) / rmag + 2 * nu / np.sqrt(np.pi) * np.exp(-(rmag * nu)**2))
+    Fewald = np.zeros((atoms.Natoms, 3))
+    np.add.at(Fewald, i, f[:, None] * dX)
+
+    # Calculate the reciprocal space contribution
+    if spme:
+        Fewald += _get_spme(atoms, nu, order, forces=True)[1]
+        return Fewald
+    G = _get_reciprocal_vectors(atoms, gcut)
+    G2 = norm(G, axis=1)**2
+    prefactor = 2 * np.pi / atoms.Omega * np.exp(-0.25 * G2 / nu**2) / G2
+    Sfi = np.exp(1j * G @ atoms.X.T)
+    Sf = Sfi @ atoms.Z
+    # d|S(G)|^2/dX_i = -2 Z_i G Im(S(G)^* exp(iGX_i))
+    dSf = np.imag(Sf.conj()[:, None] * Sfi)
+    Fewald += 2 * atoms.Z[:, None] * (dSf.T @ (prefactor[:, None] * G))
+    return Fewald
+
+
+def _get_ewald_params(atoms, gcut, gamma, spme=False):
+    '''Get the Ewald splitting parameter and the cut-offs from an error estimate.
+
+    Reference: Mol. Simul. 1, 207.
+
+    Args:
+        atoms: Atoms object.
+        gcut (float | None): G-vector cut-off, None will balance the real and reciprocal sums.
+        gamma (float): Error tolerance
+
+    Keyword Args:
+        spme (bool): Choose the splitting parameter for an SPME reciprocal sum.
+
+    Returns:
+        tuple[float, float, float]: Ewald splitting parameter, real-space and G-vector cut-off.
+    '''
+    if gcut is None or spme:
+        # The work of both sums is balanced for nu ~ sqrt(pi) (N / Omega^2)^(1/6)
+        nu = np.sqrt(np.pi) * (atoms.Natoms / atoms.Omega**2)**(1 / 6)
+        if spme:
+            # The reciprocal sum is cheap with SPME, so shorten the real-space sum with the largest
+            # splitting parameter whose Gaussians can still be interpolated on the sampling
+            gnyq = np.min(np.pi * atoms.s / norm(atoms.R, axis=1))
+            nu = max(nu, 0.2 * gnyq / np.sqrt(-np.log(gamma)))
+        # Error of the reciprocal sum: sum(Z^2) nu erfc(gcut / (2 nu)) / sqrt(pi)
+        # The estimates are no strict bounds for small systems, so each sum only gets a tenth of
+        # the error tolerance
+        y = erfcinv(min(1, 0.1 * gamma * np.sqrt(np.pi) / (np.sum(atoms.Z**2) * nu)))
+        gcut = 2 * nu * y
+    else:
+        nu = 0.5 * np.sqrt(gcut**2 / -np.log(gamma))
+    # Error of the real-space sum: pi sum(Z)^2 erfc(nu rcut) / (Omega nu^2)
+    x = erfcinv(min(1, 0.1 * gamma * atoms.Omega * nu**2 / (np.pi * np.sum(atoms.Z)**2)))
+    rcut = x / nu
+    return nu, rcut, gcut
+
+
+def _get_neighbors(atoms, rcut):
+    '''Find all pairs of atoms and periodic images of atoms inside of a cut-off radius.
+
+    Args:
+        atoms: Atoms object.
+        rcut (float): Cut-off radius.
+
+    Returns:
+        tuple[ndarray, ndarray, ndarray]: Atom indices, image atom indices, and distance vectors.
+    '''
+    # Wrap the atoms into the cell, so the images only have to cover the cut-off radius
+    X = atoms.X @ inv(atoms.R)
+    X = (X - np.floor(X)) @ atoms.R
+    s = np.ceil(rcut / norm(atoms.R, axis=1)) + 1
+    T = _get_index_vectors(s) @ atoms.R
+    images = (X[None, :, :] + T[:, None, :]).reshape(-1, 3)
+    # Search all neighbors at once with k-d trees
+    pairs = cKDTree(X).sparse_distance_matrix(cKDTree(images), rcut, output_type='ndarray')
+    # Remove the interaction of the atoms with themselves
+    pairs = pairs[pairs['v'] > 0]
+    return pairs['i'], pairs['j'] % atoms.Natoms, X[pairs['i']] - images[pairs['j']]
+
+
+def _get_spme(atoms, nu, order, forces=False):
+    '''Calculate the reciprocal space Ewald sum with the smooth particle-mesh Ewald method.
+
+    The ionic charges are spread on the real-space sampling with cardinal B-splines, such that the
+    structure factor can be calculated with one FFT.
+
+    Reference: J. Chem. Phys. 103, 8577.
+
+    Args:
+        atoms: Atoms object.
+        nu (float): Ewald splitting parameter.
+        order (int): Order of the B-splines.
+
+    Keyword Args:
+        forces (bool): Also calculate the forces.
+
+    Returns:
+        tuple[float, ndarray | None]: Reciprocal space Ewald energy and forces.
+    '''
+    s = atoms.s
+    n = np.prod(s)
+    # Scaled fractional coordinates of the atoms, wrapped into the sampling
+    u = atoms.X @ inv(atoms.R) * s
+    u -= np.floor(u / s) * s
+    k = np.floor(u).astype(int)
+    # Every atom is spread over order points per axis: M(u - k + j) with j = 0, ..., order - 1
+    x = (u - k)[:, :, None] + np.arange(order)
+    k = (k[:, :, None] - np.arange(order)) % s[:, None]
+    M = _get_bspline(x, order)
+    # Flat indices of the sampling, the first axis runs fastest (like atoms.r)
+    idx = k[:, 0, :, None, None] + s[0] * (k[:, 1, None, :, None] + s[1] * k[:, 2, None, None, :])
+    w = M[:, 0, :, None, None] * M[:, 1, None, :, None] * M[:, 2, None, None, :]
+    Q = np.bincount(idx.ravel(), weights=(atoms.Z[:, None, None, None] * w).ravel(), minlength=n)
+
+    # Structure factor of the spread charges and the influence function
+    Sf = n * atoms.J(Q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        C = 2 * np.pi / atoms.Omega * np.exp(-0.25 * atoms.G2 / nu**2) / atoms.G2
+    C[0] = 0
+    C *= _get_bspline_moduli(atoms, order)
+    Eewald = np.sum(C * np.abs(Sf)**2)
+    if not forces:
+        return Eewald, None
+
+    # dE/dQ = 2 Re(\sum_G C(G) S(G) exp(iGr)), i.e., the reciprocal space potential on the sampling
+    phi = 2 * np.real(atoms.I(C * Sf))
+    # Derivative of the B-splines: dM_p(x)/dx = M_{p-1}(x) - M_{p-1}(x - 1)
+    dM = _get_bspline(x, order - 1) - _get_bspline(x - 1, order - 1)
+    dEdu = np.empty((atoms.Natoms, 3))
+    dEdu[:, 0] = np.sum(dM[:, 0, :, None, None] * M[:, 1, None, :, None] *
+                        M[:, 2, None, None, :] * phi[idx], axis=(1, 2, 3))
+    dEdu[:, 1] = np.sum(M[:, 0, :, None, None] * dM[:, 1, None, :, None] *
+                        M[:, 2, None, None, :] * phi[idx], axis=(1, 2, 3))
+    dEdu[:, 2] = np.sum(M[:, 0, :, None, None] * M[:, 1, None, :, None] *
+                        dM[:, 2, None, None, :] * phi[idx], axis=(1, 2, 3))
+    # Transform the gradient from the scaled fractional coordinates to Cartesian coordinates
+    Fewald = -atoms.Z[:, None] * dEdu @ (inv(atoms.R) * s).T
+    return Eewald, Fewald
+
+
+def _get_bspline(x, order):
+    '''Evaluate cardinal B-splines with a recursion.
+
+    Args:
+        x (ndarray): Evaluation points.
+        order (int): Order of the B-splines.
+
+    Returns:
+        ndarray: Cardinal B-splines M_order(x).
+    '''
+    if order == 1:
+        return ((x >= 0) & (x < 1)).astype(float)
+    if order == 2:
+        return np.maximum(1 - np.abs(x - 1), 0)
+    return (x * _get_bspline(x, order - 1) + (order - x) * _get_bspline(x - 1, order - 1)) / \
+        (order - 1)
+
+
+def _get_bspline_moduli(atoms, order):
+    '''Get the squared moduli of the Euler exponential splines for all G-vectors.
+
+    Args:
+        atoms: Atoms object.
+        order (int): Order of the B-splines.
+
+    Returns:
+        ndarray: Squared B-spline moduli.
+    '''
+    # Integer frequencies of the G-vectors along every axis
+    m = np.rint(atoms.G @ atoms.R / (2 * np.pi)).astype(int) % atoms.s
+    M = _get_bspline(np.arange(1, order), order)
+    B = np.ones(len(m))
+    for i in range(3):
+        mk = np.outer(np.arange(atoms.s[i]), np.arange(order - 1)) / atoms.s[i]
+        b = np.exp(2j * np.pi * mk) @ M
+        # Odd orders have zeros at the Nyquist frequency, exclude them from the sum
+        with np.errstate(divide='ignore'):
+            b = np.where(np.abs(b) > 1e-10, 1 / np.abs(b)**2, 0)
+        B *= b[m[:, i]]
+    return B
+
+
+def _get_reciprocal_vectors(atoms, gcut):
+    '''Get all non-zero reciprocal lattice vectors inside of a cut-off radius.
+
+    Args:
+        atoms: Atoms object.
+        gcut (float): G-vector cut-off.
+
+    Returns:
+        ndarray: Reciprocal lattice vectors.
+    '''
+    g = 2 * np.pi * inv(atoms.R.T)
+    s = np.rint(gcut / norm(g, axis=1) + 1.5)
+    G = _get_index_vectors(s) @ g
+    G = G[norm(G, axis=1) <= gcut]
+    # Remove the G=[0, 0, 0] element
+    return G[np.any(G != 0, axis=1)]
+
+
+def _get_index_vectors(s):
+    '''Create all index vectors of periodic images.
+
+    Args:
+        s (ndarray): Number of images per lattice vector.
+
+    Returns:
+        ndarray: Index matrix.
+    '''
+    m1 = np.arange(-s[0], s[0] + 1)
+    m2 = np.arange(-s[1], s[1] + 1)
+    m3 = np.arange(-s[2], s[2] + 1)
+    return np.transpose(np.meshgrid(m1, m2, m3)).reshape(-1, 3)
+
+
 def get_Esic(scf, Y, n_single=None):
     '''Calculate the Perdew-Zunger self-interaction energy.
 
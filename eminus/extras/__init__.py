@@ -7,13 +7,15 @@ To also install all additional dependencies, use::
 
 Alternativle, you can only install selected extras using the respective name:
 
+* :mod:`~eminus.extras.fftw`
 * :mod:`~eminus.extras.fods`
 * :mod:`~eminus.extras.libxc`
 * :mod:`~eminus.extras.viewer`
 '''
+from .fftw import fftw_load_wisdom, fftw_save_wisdom, fftw_transform
 from .fods import get_fods, remove_core_fods, split_fods
 from .libxc import libxc_functional
 from .viewer import view_grid, view_mol
 
-__all__ = ['get_fods', 'libxc_functional', 'remove_core_fods', 'split_fods', 'view_grid',
-           'view_mol']
+__all__ = ['fftw_load_wisdom', 'fftw_save_wisdom', 'fftw_transform', 'get_fods', 'libxc_functional',
+           'remove_core_fods', 'split_fods', 'view_grid', 'view_mol']
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+'''Interface to use FFTW via pyFFTW.
+
+Plans will be created once per transformation, grid shape, data type, axes, and number of threads,
+and will be reused for all following transformations. Only the MAX_PLANS most recently used plans
+will be kept. The accumulated wisdom can be stored in a file to skip the planning in subsequent
+runs.
+
+Use it by setting the FFT backend, i.e., with :func:`~eminus.fft.set_backend`.
+
+One can install pyFFTW with::
+
+    pip install eminus[fftw]
+'''
+import collections
+import pickle
+
+from ..logger import log
+
+MAX_PLANS = 32                     # Maximum number of cached plans
+PLANS = collections.OrderedDict()  # Cache of FFTW objects, from least to most recently used
+WISDOM = None                      # Wisdom file that will be updated with new plans
+
+
+def fftw_transform(kind, a, s=None, axes=None, workers=None):
+    '''Handle FFTs via pyFFTW using cached plans.
+
+    Reference: Proc. IEEE 93, 216.
+
+    Args:
+        kind (str): Transformation name, i.e., 'fftn', 'ifftn', 'rfftn', or 'irfftn'.
+        a (ndarray): Input array.
+
+    Keyword Args:
+        s (tuple | ndarray | None): Shape of the output along the transformed axes.
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the pyFFTW default.
+
+    Returns:
+        ndarray: Transformed array.
+    '''
+    pyfftw = _import_pyfftw()
+    if workers is None:
+        workers = pyfftw.config.NUM_THREADS
+    if s is not None:
+        s = tuple(s)
+
+    key = (kind, a.shape, a.dtype, s, axes, workers)
+    try:
+        plan = PLANS[key]
+        PLANS.move_to_end(key)
+    except KeyError:
+        # Plan with a dummy array, since the planning can overwrite the input
+        dummy = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+        kwargs = {'axes': axes, 'threads': workers, 'planner_effort': 'FFTW_MEASURE'}
+        if s is not None:
+            kwargs['s'] = s
+        plan = getattr(pyfftw.builders, kind)(dummy, **kwargs)
+        PLANS[key] = plan
+        # Drop the least recently used plan, the wisdom keeps the planning of it cheap
+        if len(PLANS) > MAX_PLANS:
+            PLANS.popitem(last=False)
+        log.debug(f'Created FFTW plan for {kind} with shape {a.shape}.')
+        if WISDOM is not None:
+            fftw_save_wisdom(WISDOM)
+
+    # Complex-to-real transformations destroy their input, so never run them on the callers array
+    if kind == 'irfftn':
+        tmp = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+        tmp[...] = a
+        a = tmp
+    # Write into a new output array, since the internal output array gets reused in every call
+    out = pyfftw.empty_aligned(plan.output_shape, dtype=plan.output_dtype)
+    return plan(a, out)
+
+
+def fftw_load_wisdom(filename):
+    '''Load FFTW wisdom from a file and use the file to store newly accumulated wisdom.
+
+    Args:
+        filename (str): Wisdom file path/name.
+    '''
+    global WISDOM
+    pyfftw = _import_pyfftw()
+    WISDOM = filename
+    try:
+        with open(filename, 'rb') as fh:
+            pyfftw.import_wisdom(pickle.load(fh))
+    except FileNotFoundError:
+        log.info(f'No wisdom file found, it will be created at "{filename}".')
+    return
+
+
+def fftw_save_wisdom(filename):
+    '''Save the accumulated FFTW wisdom to a file.
+
+    Args:
+        filename (str): Wisdom file path/name.
+    '''
+    pyfftw = _import_pyfftw()
+    with open(filename, 'wb') as fp:
+        pickle.dump(pyfftw.export_wisdom(), fp, pickle.HIGHEST_PROTOCOL)
+    return
+
+
+def _import_pyfftw():
+    '''Import pyFFTW and handle missing dependencies.
+
+    Returns:
+        module: pyFFTW module.
+    '''
+    try:
+        import pyfftw
+    except ImportError:
+        log.exception('Necessary dependencies not found. To use this module, '
+                      'install them with "pip install eminus[fftw]".\n\n')
+        raise
+    return pyfftw
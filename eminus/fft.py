@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+'''FFT backends used by the plane wave operators.
+
+The operators in :mod:`~eminus.operators` call the transformations of this module, that will be
+dispatched to the selected backend. Available backends are:
+
+* 'scipy': pocketfft (C++) from SciPy (default)
+* 'numpy': pocketfft (C) from NumPy, single-threaded
+* 'fftw': FFTW via pyFFTW, see :mod:`~eminus.extras.fftw`
+
+SciPy and NumPy cache their plans internally. For FFTW, plans will be created once per grid shape,
+data type, and axes, and the accumulated wisdom can be stored on the disk.
+
+The number of threads defaults to OMP_NUM_THREADS. It can be changed globally with
+:func:`~eminus.fft.set_threads`, for a block of code with :func:`~eminus.fft.threads`, or per call
+with the workers argument.
+
+Example::
+
+   from eminus.fft import set_backend, threads
+   set_backend('fftw', wisdom='fftw.wisdom')
+   with threads(4):
+       scf.run()
+'''
+import contextlib
+import os
+
+import numpy as np
+import scipy.fft
+
+from .logger import log
+
+try:
+    THREADS = int(os.environ['OMP_NUM_THREADS'])
+except KeyError:
+    THREADS = None
+BACKEND = 'scipy'  # Selected FFT backend
+
+
+def set_backend(backend, wisdom=None):
+    '''Set the FFT backend used by the operators.
+
+    Args:
+        backend (str): FFT backend, i.e., 'scipy', 'numpy', or 'fftw' (case insensitive).
+
+    Keyword Args:
+        wisdom (str | None): FFTW wisdom file that will be loaded and updated with new plans.
+
+    Returns:
+        None.
+    '''
+    global BACKEND
+    backend = backend.lower()
+    if backend not in ('fftw', 'numpy', 'scipy'):
+        log.error(f'No FFT backend found for "{backend}"')
+        return
+    if backend == 'fftw':
+        # Import the interface early to catch missing dependencies here
+        from .extras.fftw import fftw_load_wisdom
+        if wisdom is not None:
+            fftw_load_wisdom(wisdom)
+    elif wisdom is not None:
+        log.warning(f'Wisdom files are only supported by the FFTW backend, not by "{backend}".')
+    BACKEND = backend
+    return
+
+
+def set_threads(workers):
+    '''Set the default number of threads for all transformations.
+
+    Args:
+        workers (int | None): Number of threads, None will use the backend default.
+    '''
+    global THREADS
+    THREADS = workers
+    return
+
+
+@contextlib.contextmanager
+def threads(workers):
+    '''Context manager to temporarily change the number of threads for all transformations.
+
+    Args:
+        workers (int | None): Number of threads, None will use the backend default.
+    '''
+    default = THREADS
+    set_threads(workers)
+    try:
+        yield
+    finally:
+        set_threads(default)
+
+
+def fftn(a, axes=None, workers=None):
+    '''Forward n-dimensional complex-to-complex FFT.
+
+    Args:
+        a (ndarray): Input array.
+
+    Keyword Args:
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the global default.
+
+    Returns:
+        ndarray: Transformed array.
+    '''
+    return _transform('fftn', a, axes=axes, workers=workers)
+
+
+def ifftn(a, axes=None, workers=None):
+    '''Backward n-dimensional complex-to-complex FFT.
+
+    Args:
+        a (ndarray): Input array.
+
+    Keyword Args:
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the global default.
+
+    Returns:
+        ndarray: Transformed array.
+    '''
+    return _transform('ifftn', a, axes=axes, workers=workers)
+
+
+def rfftn(a, axes=None, workers=None):
+    '''Forward n-dimensional real-to-complex FFT.
+
+    Args:
+        a (ndarray): Real-valued input array.
+
+    Keyword Args:
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the global default.
+
+    Returns:
+        ndarray: Half spectrum of the transformed array.
+    '''
+    return _transform('rfftn', a, axes=axes, workers=workers)
+
+
+def irfftn(a, s, axes=None, workers=None):
+    '''Backward n-dimensional complex-to-real FFT.
+
+    Args:
+        a (ndarray): Half spectrum of a Hermitian-symmetric array.
+        s (tuple | ndarray): Shape of the real-valued output along the transformed axes.
+
+    Keyword Args:
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the global default.
+
+    Returns:
+        ndarray: Real-valued transformed array.
+    '''
+    return _transform('irfftn', a, s=s, axes=axes, workers=workers)
+
+
+def _transform(kind, a, s=None, axes=None, workers=None):
+    '''Dispatch a transformation to the selected backend.
+
+    Args:
+        kind (str): Transformation name, i.e., 'fftn', 'ifftn', 'rfftn', or 'irfftn'.
+        a (ndarray): Input array.
+
+    Keyword Args:
+        s (tuple | ndarray | None): Shape of the output along the transformed axes.
+        axes (tuple | None): Axes to transform, None will transform all axes.
+        workers (int | None): Number of threads, None will use the global default.
+
+    Returns:
+        ndarray: Transformed array.
+    '''
+    if workers is None:
+        workers = THREADS
+    if BACKEND == 'fftw':
+        from .extras.fftw import fftw_transform
+        return fftw_transform(kind, a, s=s, axes=axes, workers=workers)
+
+    kwargs = {}
+    if s is not None:
+        kwargs['s'] = s
+    if BACKEND == 'numpy':
+        # NumPy does not support multithreading
+        return getattr(np.fft, kind)(a, axes=axes, **kwargs)
+    return getattr(scipy.fft, kind)(a, axes=axes, workers=workers, **kwargs)
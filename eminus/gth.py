@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 '''Utilities to use Goedecker, Teter, and Hutter (GTH) pseudopotentials.'''
 import numpy as np
+from scipy.linalg import norm
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.special import spherical_jn
 
 from .logger import log
-from .utils import Ylm_real
+from .utils import Ylm_real_all
 
 
 def init_gth_loc(scf):
@@ -21,7 +24,7 @@ def init_gth_loc(scf):
     species = set(atoms.atom)
     omega = 1  # Normally this would be det(atoms.R), but Arias notation is off by this factor
 
-    Vloc = np.zeros_like(atoms.G2)
+    Vloc = np.zeros_like(atoms.G2, dtype=complex)
     for isp in species:
         psp = scf.GTH[isp]
         rloc = psp['rloc']
@@ -48,12 +51,15 @@ def init_gth_loc(scf):
         for ia in range(len(atoms.atom)):
             if atoms.atom[ia] == isp:
                 Sf += atoms.Sf[ia]
-        Vloc += np.real(atoms.J(Vsp * Sf))
-    return Vloc
+        Vloc += Vsp * Sf
+    # Only the real part of J(Vloc) is needed, i.e., the transformation of its Hermitian part
+    # The transformation J of a Hermitian-symmetric spectrum equals Jdag of its conjugate
+    Vloc = 0.5 * (Vloc + Vloc[atoms.neg].conj())
+    return atoms.Jdag(Vloc.conj(), True)
 
 
 # Adapted from https://github.com/f-fathurrahman/PWDFT.jl/blob/master/src/PsPotNL.jl
-def init_gth_nonloc(scf):
+def init_gth_nonloc(scf, reciprocal=True):
     '''Initialize parameters to calculate non-local contributions of GTH pseudopotentials.
 
     Reference: Phys. Rev. B 54, 1703.
@@ -61,8 +67,11 @@ def init_gth_nonloc(scf):
     Args:
         scf: SCF object.
 
+    Keyword Args:
+        reciprocal (bool): Build the projectors in reciprocal space, otherwise betaNL will be None.
+
     Returns:
-        tuple[int, ndarray, ndarray]: NbetaNL, prj2beta, and betaNL.
+        tuple[int, ndarray, ndarray | None, csr_matrix]: NbetaNL, prj2beta, betaNL, and D.
     '''
     atoms = scf.atoms
     prj2beta = np.zeros((3, atoms.Natoms, 4, 7), dtype=int)
@@ -77,22 +86,196 @@ def init_gth_nonloc(scf):
                     NbetaNL += 1
                     prj2beta[iprj, ia, l, m + psp['lmax'] - 1] = NbetaNL
 
+    # Couple the projectors with the same atom, l, and m in a block-diagonal matrix D
+    row, col, data = [], [], []
+    for ia in range(atoms.Natoms):
+        psp = scf.GTH[atoms.atom[ia]]
+        for l in range(psp['lmax']):
+            for m in range(-l, l + 1):
+                for iprj in range(psp['Nproj_l'][l]):
+                    for jprj in range(psp['Nproj_l'][l]):
+                        row.append(prj2beta[iprj, ia, l, m + psp['lmax'] - 1] - 1)
+                        col.append(prj2beta[jprj, ia, l, m + psp['lmax'] - 1] - 1)
+                        data.append(psp['h'][l, iprj, jprj])
+    D = csr_matrix((data, (row, col)), shape=(NbetaNL, NbetaNL))
+
+    betaNL = _get_betaNL(scf, NbetaNL) if reciprocal else None
+    return NbetaNL, prj2beta, betaNL, D
+
+
+def _get_betaNL(scf, NbetaNL):
+    '''Build the non-local GTH projectors in the active reciprocal space.
+
+    Args:
+        scf: SCF object.
+        NbetaNL (int): Number of projector functions.
+
+    Returns:
+        ndarray: Projector functions with the structure factors of the atoms.
+    '''
+    atoms = scf.atoms
     g = atoms.G[atoms.active]  # Simplified, would normally be G+k
     Gm = np.sqrt(atoms.G2c)
+    # It is very important to transform the structure factor to make both notations compatible
+    # Idag(J(Sf)) equals the structure factor of the negated G-vectors, calculate it directly
+    Sf = np.exp(1j * atoms.G[atoms.neg[atoms.active]] @ atoms.X.T)
+    # Evaluate the spherical harmonics of all species at once
+    lmax = max(scf.GTH[isp]['lmax'] for isp in set(atoms.atom))
+    Ylm = Ylm_real_all(max(lmax - 1, 0), g)
+
+    # Build the projectors without the structure factor once per species
+    proj = {}
+    for isp in set(atoms.atom):
+        psp = scf.GTH[isp]
+        prj = []
+        for l in range(psp['lmax']):
+            prj_l = [eval_proj_G(psp, l, iprj + 1, Gm, atoms.Omega)
+                     for iprj in range(psp['Nproj_l'][l])]
+            for m in range(-l, l + 1):
+                prj += [(-1j)**l * Ylm[l**2 + l + m] * prj_lm for prj_lm in prj_l]
+        proj[isp] = np.array(prj).T if prj else np.empty((len(Gm), 0), dtype=complex)
 
     ibeta = 0
     betaNL = np.empty((len(atoms.G2c), NbetaNL), dtype=complex)
     for ia in range(atoms.Natoms):
-        # It is very important to transform the structure factor to make both notations compatible
-        Sf = atoms.Idag(atoms.J(atoms.Sf[ia]))
+        Nbeta = proj[atoms.atom[ia]].shape[1]
+        betaNL[:, ibeta:ibeta + Nbeta] = proj[atoms.atom[ia]] * Sf[:, ia:ia + 1]
+        ibeta += Nbeta
+    return betaNL
+
+
+def init_gth_nonloc_rs(scf, Nr=800, Nq=6000):
+    '''Initialize non-local GTH projectors in real-space, truncated to spheres around the atoms.
+
+    The projectors will be optimized with the mask function method, i.e., the radial projectors
+    are divided by a smooth mask, Fourier filtered, and multiplied with the mask again. This keeps
+    the components inside of the active space, while the projectors vanish outside of the spheres.
+    The projections are only approximate, with typical errors of about 1e-4 Hartree.
+
+    Reference: Phys. Rev. B 44, 13063; Phys. Rev. B 64, 201107.
+
+    Args:
+        scf: SCF object.
+
+    Keyword Args:
+        Nr (int): Number of radial grid points.
+        Nq (int): Number of reciprocal radial grid points.
+
+    Returns:
+        tuple[ndarray, csc_matrix]: Indices of the sample points inside of the spheres and the
+        sparse real-space projector functions on them, with the same order as betaNL.
+    '''
+    atoms = scf.atoms
+    # Radius of the wave function cut-off sphere
+    Gw = np.sqrt(np.max(atoms.G2c))
+    q = np.linspace(0, 60, Nq)
+
+    proj = {}
+    row, col, data = [], [], []
+    ibeta = 0
+    for ia in range(atoms.Natoms):
         psp = scf.GTH[atoms.atom[ia]]
+        # The projectors need a few oscillations of the largest active G-vector to be represented
+        R0 = max(3 * np.pi / Gw, 5 * np.max(psp['rp']))
+        # Minimum image distances of all sample points to the atom
+        d = atoms.r - atoms.X[ia]
+        d -= np.round(d / np.diag(atoms.R)) * np.diag(atoms.R)
+        dist = norm(d, axis=1)
+        idx = np.nonzero(dist < R0)[0]
+        Ylm = Ylm_real_all(max(psp['lmax'] - 1, 0), d[idx])
         for l in range(psp['lmax']):
+            for iprj in range(psp['Nproj_l'][l]):
+                # Build the radial projectors once per species
+                key = (atoms.atom[ia], l, iprj)
+                if key not in proj:
+                    proj[key] = _get_proj_rs(psp, l, iprj + 1, atoms.Omega, q, Gw, R0, Nr)
             for m in range(-l, l + 1):
                 for iprj in range(psp['Nproj_l'][l]):
-                    betaNL[:, ibeta] = (-1j)**l * Ylm_real(l, m, g) * \
-                        eval_proj_G(psp, l, iprj + 1, Gm, atoms.Omega) * Sf
+                    r, prj = proj[atoms.atom[ia], l, iprj]
+                    row.append(idx)
+                    col.append(np.full(len(idx), ibeta))
+                    data.append(np.interp(dist[idx], r, prj) * Ylm[l**2 + l + m])
                     ibeta += 1
-    return NbetaNL, prj2beta, betaNL
+    if ibeta == 0:
+        return np.empty(0, dtype=int), csc_matrix((0, 0))
+    row, col, data = np.concatenate(row), np.concatenate(col), np.concatenate(data)
+    # Only store the sample points that are inside of at least one sphere
+    idx, row = np.unique(row, return_inverse=True)
+    return idx, csc_matrix((data, (row, col)), shape=(len(idx), scf.NbetaNL))
+
+
+def _get_proj_rs(psp, l, iprj, Omega, q, Gw, R0, Nr):
+    '''Build a radial real-space projector with the mask function method.
+
+    The radial transformations use the same normalization as I, i.e., the projections follow from a
+    sum over the sampling divided by the number of sample points.
+
+    Args:
+        psp (dict): GTH parameters.
+        l (int): Angular momentum number.
+        iprj (int): Nproj_l index.
+        Omega (float): Unit cell volume.
+        q (ndarray): Reciprocal radial grid.
+        Gw (float): Radius of the wave function cut-off sphere.
+        R0 (float): Radius of the projector sphere.
+        Nr (int): Number of radial grid points.
+
+    Returns:
+        tuple[ndarray, ndarray]: Radial grid and radial projector.
+    '''
+    r = np.linspace(0, R0, Nr)
+    dr, dq = r[1] - r[0], q[1] - q[0]
+    jqr = spherical_jn(l, np.outer(q, r))
+    mask = np.exp(-5 * (r / R0)**2)
+    # Transform the projector to real-space and divide it by the mask
+    prj = Omega / (2 * np.pi**2) * (q**2 * eval_proj_G(psp, l, iprj, q, Omega)) @ jqr * dq
+    # Filter the masked projector, components above the cut-off are free to choose
+    prj_q = 4 * np.pi * (jqr @ (r**2 * prj / mask)) * dr
+    prj_q[q > 2.5 * Gw] = 0
+    prj = (q**2 * prj_q) @ jqr * dq / (2 * np.pi**2)
+    return r, prj * mask
+
+
+def calc_proj_rs(scf, Wrs):
+    '''Calculate the projections of real-space wave functions on the real-space projectors.
+
+    Args:
+        scf: SCF object.
+        Wrs (ndarray): Real-space wave functions.
+
+    Returns:
+        ndarray: Projections betaNLdag W.
+    '''
+    idx, betaNL = scf.betaNL_rs
+    # The projections betaNLdag W follow from the sum over the sample points inside the spheres
+    return betaNL.T @ Wrs[idx] / np.prod(scf.atoms.s)
+
+
+def calc_Vnonloc_rs(scf, Wrs, out):
+    '''Calculate the non-local pseudopotential in real-space, applied on real-space wave functions.
+
+    Only the sample points inside of the projector spheres will be gathered and updated.
+
+    Reference: Phys. Rev. B 44, 13063.
+
+    Args:
+        scf: SCF object.
+        Wrs (ndarray): Real-space wave functions.
+        out (ndarray): Real-space array the non-local contribution will be added to.
+
+    Returns:
+        ndarray: out with the non-local GTH potential contribution.
+    '''
+    atoms = scf.atoms
+    if scf.NbetaNL == 0:  # Only calculate non-local potential if necessary
+        return out
+
+    n = np.prod(atoms.s)
+    idx, betaNL = scf.betaNL_rs
+    betaNL_psi = calc_proj_rs(scf, Wrs)
+    # Vnonloc = Idag(Omega / n betaNL_rs D betaNL_rsdag I(W) / n)
+    out[idx] += betaNL @ (scf.D @ betaNL_psi) * (atoms.Omega / n)
+    return out
 
 
 # Adapted from https://github.com/f-fathurrahman/PWDFT.jl/blob/master/src/op_V_Ps_nloc.jl
@@ -110,20 +293,12 @@ def calc_Vnonloc(scf, W):
     '''
     atoms = scf.atoms
 
-    Vpsi = np.zeros_like(W, dtype=complex)
-    if scf.NbetaNL > 0:  # Only calculate non-local potential if necessary
-        betaNL_psi = (W.conj().T @ scf.betaNL).conj()
-
-        for ia in range(atoms.Natoms):
-            psp = scf.GTH[atoms.atom[ia]]
-            for l in range(psp['lmax']):
-                for m in range(-l, l + 1):
-                    for iprj in range(psp['Nproj_l'][l]):
-                        ibeta = scf.prj2beta[iprj, ia, l, m + psp['lmax'] - 1] - 1
-                        for jprj in range(psp['Nproj_l'][l]):
-                            jbeta = scf.prj2beta[jprj, ia, l, m + psp['lmax'] - 1] - 1
-                            hij = psp['h'][l, iprj, jprj]
-                            Vpsi += hij * betaNL_psi[:, jbeta] * scf.betaNL[:, ibeta][:, None]
+    if scf.NbetaNL == 0:  # Only calculate non-local potential if necessary
+        return np.zeros_like(W, dtype=complex)
+
+    # Vnonloc = betaNL D betaNLdag W
+    betaNL_psi = atoms.dot(scf.betaNL, W)
+    Vpsi = scf.betaNL @ (scf.D @ betaNL_psi)
     # We have to multiply with the cell volume, because of different orthogonalization methods
     return Vpsi * atoms.Omega
 
@@ -3,12 +3,15 @@
 import logging
 
 import numpy as np
+from numpy.random import Generator, SFC64
 
-from .dft import get_grad, get_n_spin, get_n_total, orth, solve_poisson
+from .dft import chebyshev_filter, davidson, get_grad, get_n, get_upper_bound, get_Veff, \
+    get_xc_dens, orth, Overlap, rayleigh_ritz, solve_poisson
 from .energies import get_E
+from .gth import calc_proj_rs
 from .logger import name
+from .operators import project_gamma
 from .utils import dotprod
-from .xc import get_xc
 
 
 def scf_step(scf):
@@ -23,12 +26,23 @@ def scf_step(scf):
         float: Total energy.
     '''
     atoms = scf.atoms
-    scf.Y = orth(atoms, scf.W)
-    scf.n = get_n_total(atoms, scf.Y)
-    scf.n_spin = get_n_spin(atoms, scf.Y, scf.n)
+    # The overlaps will be reused in the gradient calculations until scf.W changes
+    scf.U = [Overlap(atoms, W) for W in scf.W]
+    scf.Y = np.asarray([U.orth(scf.orth) for U in scf.U])
+    # Real-space projectors reuse the blocks of real-space wave functions of the density
+    if scf.betaNL_rs is not None and scf.NbetaNL > 0:
+        betaNL_psi = np.empty((atoms.Nspin, scf.NbetaNL, scf.Y.shape[-1]), dtype=complex)
+
+        def project(spin, states, Yrs):
+            betaNL_psi[spin][:, states] = calc_proj_rs(scf, Yrs)
+    else:
+        betaNL_psi, project = None, None
+    scf.n, scf.n_spin = get_n(atoms, scf.Y, func=project)
     scf.phi = solve_poisson(atoms, scf.n)
-    scf.exc, scf.vxc = get_xc(scf.xc, scf.n_spin, atoms.Nspin)
-    return get_E(scf)
+    scf.exc, scf.vxc = get_xc_dens(atoms, scf.xc, scf.n_spin, atoms.Nspin)
+    # The effective potential will be reused in H as long as scf.phi and scf.vxc are passed
+    scf.Veff = get_Veff(scf, scf.phi, scf.vxc)
+    return get_E(scf, betaNL_psi)
 
 
 def check_energies(scf, Elist, linmin='', cg=''):
@@ -60,6 +74,11 @@ def check_energies(scf, Elist, linmin='', cg=''):
         scf.log.info(f'Iteration: {iteration} \tEtot: {scf.energies.Etot:+.{scf.print_precision}f}')
 
     if iteration > 1:
+        # Switch to double precision once the energy changes get close to the convergence tolerance
+        if scf.W.dtype == np.complex64 and abs(Elist[-2] - Elist[-1]) < 1e3 * scf.etol:
+            scf.log.info('Switch to double precision.')
+            scf.W = scf.W.astype(complex)
+            return True
         # Check for convergence
         if abs(Elist[-2] - Elist[-1]) < scf.etol:
             return True
@@ -70,7 +89,8 @@ def check_energies(scf, Elist, linmin='', cg=''):
 
 
 @name('steepest descent minimization')
-def sd(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5):
+def sd(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5,
+       Ndiis=0, linesearch='gradient'):
     '''Steepest descent minimization algorithm.
 
     Args:
@@ -81,27 +101,44 @@ def sd(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
         cost (Callable): Function that will run every SCF step.
         grad (Callable): Function that calculates the respective gradient.
         condition (Callable): Function to check and log the convergence condition.
-        betat (float): SCF step size.
+        betat (float): SCF step size, i.e., the trial step of the energy line search.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+            Only used with the gradient line search.
+        linesearch (str): Line search method, i.e., 'gradient' for fixed steps of size betat along
+            the gradient, or 'energy' for a quadratic fit of the energy at a trial step with Armijo
+            backtracking, where the trial step adapts to the last step size.
 
     Returns:
         list: Total energies per SCF cycle.
     '''
     atoms = scf.atoms
     costs = []
+    # History of wave functions and search directions for the DIIS extrapolation
+    hist = []
 
+    c = None
     for _ in range(Nit):
-        c = cost(scf)
+        # The energy line search already calculated the energy of the current wave functions
+        if c is None:
+            c = cost(scf)
         costs.append(c)
         if condition(scf, costs):
             break
-        for spin in range(atoms.Nspin):
-            g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
-            scf.W[spin] = scf.W[spin] - betat * g
+        g = np.asarray([grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
+                        for spin in range(atoms.Nspin)])
+        if linesearch == 'energy':
+            slope = sum(-2 * dotprod(g[spin], g[spin], atoms) for spin in range(atoms.Nspin))
+            c, betat = _linmin_energy(scf, cost, c, -g, slope, betat)
+        else:
+            W = scf.W[:atoms.Nspin] - betat * g
+            scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, g, Ndiis)
+            c = None
     return costs
 
 
 @name('line minimization')
-def lm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5):
+def lm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5, Ndiis=0,
+       linesearch='gradient'):
     '''Line minimization algorithm.
 
     Args:
@@ -112,32 +149,46 @@ def lm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
         cost (Callable): Function that will run every SCF step.
         grad (Callable): Function that calculates the respective gradient.
         condition (Callable): Function to check and log the convergence condition.
-        betat (float): SCF step size.
+        betat (float): SCF step size, i.e., the trial step of the line search.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+            Only used with the gradient line search.
+        linesearch (str): Line search method, i.e., 'gradient' for a secant step from the gradient
+            at a trial step, or 'energy' for a quadratic fit of the energy at a trial step with
+            Armijo backtracking, where the trial step adapts to the last step size.
 
     Returns:
         list: Total energies per SCF cycle.
     '''
     atoms = scf.atoms
     costs = []
+    # History of wave functions and search directions for the DIIS extrapolation
+    hist = []
 
     # Scalars that need to be saved for each spin
     linmin = np.empty(atoms.Nspin)
     beta = np.empty(atoms.Nspin)
+    slope = np.empty(atoms.Nspin)
 
     # Gradients that need to be saved for each spin
-    d = np.empty_like(scf.W, dtype=complex)
+    d = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
 
     # Do the first step without the linmin test
     for spin in range(atoms.Nspin):
         g = grad(scf, spin, scf.W)
         d[spin] = -g
-        gt = grad(scf, spin, scf.W + betat * d[spin])
-        beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+        if linesearch == 'energy':
+            slope[spin] = 2 * dotprod(g, d[spin], atoms)
+        else:
+            gt = grad(scf, spin, scf.W + betat * d[spin])
+            beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
     # Update wave functions after calculating the gradients for each spin
-    for spin in range(atoms.Nspin):
-        scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-    c = cost(scf)
+    if linesearch == 'energy':
+        c, betat = _linmin_energy(scf, cost, cost(scf), d, np.sum(slope), betat)
+        beta[:] = betat
+    else:
+        W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+        scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, -d[:atoms.Nspin], Ndiis)
+        c = cost(scf)
     costs.append(c)
     condition(scf, costs)
 
@@ -146,15 +197,21 @@ def lm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
             g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
             # Calculate linmin each spin seperately
             if scf.log.level <= logging.DEBUG:
-                linmin[spin] = dotprod(g, d[spin]) / \
-                    np.sqrt(dotprod(g, g) * dotprod(d[spin], d[spin]))
+                linmin[spin] = dotprod(g, d[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(d[spin], d[spin], atoms))
             d[spin] = -g
-            gt = grad(scf, spin, scf.W + betat * d[spin])
-            beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
-        for spin in range(atoms.Nspin):
-            scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-        c = cost(scf)
+            if linesearch == 'energy':
+                slope[spin] = 2 * dotprod(g, d[spin], atoms)
+            else:
+                gt = grad(scf, spin, scf.W + betat * d[spin])
+                beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
+        if linesearch == 'energy':
+            c, betat = _linmin_energy(scf, cost, costs[-1], d, np.sum(slope), betat)
+            beta[:] = betat
+        else:
+            W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+            scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, -d[:atoms.Nspin], Ndiis)
+            c = cost(scf)
         costs.append(c)
         if condition(scf, costs, linmin):
             break
@@ -162,7 +219,8 @@ def lm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
 
 
 @name('preconditioned line minimization')
-def pclm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5):
+def pclm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5, Ndiis=0,
+         linesearch='gradient'):
     '''Preconditioned line minimization algorithm.
 
     Args:
@@ -173,32 +231,46 @@ def pclm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat
         cost (Callable): Function that will run every SCF step.
         grad (Callable): Function that calculates the respective gradient.
         condition (Callable): Function to check and log the convergence condition.
-        betat (float): SCF step size.
+        betat (float): SCF step size, i.e., the trial step of the line search.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+            Only used with the gradient line search.
+        linesearch (str): Line search method, i.e., 'gradient' for a secant step from the gradient
+            at a trial step, or 'energy' for a quadratic fit of the energy at a trial step with
+            Armijo backtracking, where the trial step adapts to the last step size.
 
     Returns:
         list: Total energies per SCF cycle.
     '''
     atoms = scf.atoms
     costs = []
+    # History of wave functions and search directions for the DIIS extrapolation
+    hist = []
 
     # Scalars that need to be saved for each spin
     linmin = np.empty(atoms.Nspin)
     beta = np.empty(atoms.Nspin)
+    slope = np.empty(atoms.Nspin)
 
     # Gradients that need to be saved for each spin
-    d = np.empty_like(scf.W, dtype=complex)
+    d = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
 
     # Do the first step without the linmin test
     for spin in range(atoms.Nspin):
         g = grad(scf, spin, scf.W)
         d[spin] = -atoms.K(g)
-        gt = grad(scf, spin, scf.W + betat * d[spin])
-        beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+        if linesearch == 'energy':
+            slope[spin] = 2 * dotprod(g, d[spin], atoms)
+        else:
+            gt = grad(scf, spin, scf.W + betat * d[spin])
+            beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
     # Update wave functions after calculating the gradients for each spin
-    for spin in range(atoms.Nspin):
-        scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-    c = cost(scf)
+    if linesearch == 'energy':
+        c, betat = _linmin_energy(scf, cost, cost(scf), d, np.sum(slope), betat)
+        beta[:] = betat
+    else:
+        W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+        scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, -d[:atoms.Nspin], Ndiis)
+        c = cost(scf)
     costs.append(c)
     condition(scf, costs)
 
@@ -207,15 +279,21 @@ def pclm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat
             g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
             # Calculate linmin each spin seperately
             if scf.log.level <= logging.DEBUG:
-                linmin[spin] = dotprod(g, d[spin]) / \
-                    np.sqrt(dotprod(g, g) * dotprod(d[spin], d[spin]))
+                linmin[spin] = dotprod(g, d[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(d[spin], d[spin], atoms))
             d[spin] = -atoms.K(g)
-            gt = grad(scf, spin, scf.W + betat * d[spin])
-            beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
-        for spin in range(atoms.Nspin):
-            scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-        c = cost(scf)
+            if linesearch == 'energy':
+                slope[spin] = 2 * dotprod(g, d[spin], atoms)
+            else:
+                gt = grad(scf, spin, scf.W + betat * d[spin])
+                beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
+        if linesearch == 'energy':
+            c, betat = _linmin_energy(scf, cost, costs[-1], d, np.sum(slope), betat)
+            beta[:] = betat
+        else:
+            W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+            scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, -d[:atoms.Nspin], Ndiis)
+            c = cost(scf)
         costs.append(c)
         if condition(scf, costs, linmin):
             break
@@ -223,7 +301,8 @@ def pclm(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat
 
 
 @name('conjugate-gradient minimization')
-def cg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5):
+def cg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5,
+       Ndiis=0, linesearch='gradient'):
     '''Conjugate-gradient minimization algorithm.
 
     Args:
@@ -234,66 +313,91 @@ def cg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
         cost (Callable): Function that will run every SCF step.
         grad (Callable): Function that calculates the respective gradient.
         condition (Callable): Function to check and log the convergence condition.
-        betat (float): SCF step size.
+        betat (float): SCF step size, i.e., the trial step of the line search.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+            Only used with the gradient line search.
+        linesearch (str): Line search method, i.e., 'gradient' for a secant step from the gradient
+            at a trial step, or 'energy' for a quadratic fit of the energy at a trial step with
+            Armijo backtracking, where the trial step adapts to the last step size.
 
     Returns:
         list: Total energies per SCF cycle.
     '''
     atoms = scf.atoms
     costs = []
+    # History of wave functions and gradients for the DIIS extrapolation
+    hist = []
 
     # Scalars that need to be saved for each spin
     linmin = np.empty(atoms.Nspin)
     cg = np.empty(atoms.Nspin)
     beta = np.empty(atoms.Nspin)
+    slope = np.empty(atoms.Nspin)
 
     # Gradients that need to be saved for each spin
-    d = np.empty_like(scf.W, dtype=complex)
-    d_old = np.empty_like(scf.W, dtype=complex)
-    g_old = np.empty_like(scf.W, dtype=complex)
+    d = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    d_old = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    g_old = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
 
     # Do the first step without the linmin and cg test
     for spin in range(atoms.Nspin):
         g = grad(scf, spin, scf.W)
         d[spin] = -g
-        gt = grad(scf, spin, scf.W + betat * d[spin])
-        beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+        if linesearch == 'energy':
+            slope[spin] = 2 * dotprod(g, d[spin], atoms)
+        else:
+            gt = grad(scf, spin, scf.W + betat * d[spin])
+            beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
         d_old[spin] = d[spin]
         g_old[spin] = g
     # Update wave functions after calculating the gradients for each spin
-    for spin in range(atoms.Nspin):
-        scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-    c = cost(scf)
+    if linesearch == 'energy':
+        c, betat = _linmin_energy(scf, cost, cost(scf), d, np.sum(slope), betat)
+        beta[:] = betat
+    else:
+        W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+        scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, g_old[:atoms.Nspin], Ndiis)
+        c = cost(scf)
     costs.append(c)
     condition(scf, costs)
+    restart = False
 
     for _ in range(1, Nit):
         for spin in range(atoms.Nspin):
             g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
             # Calculate linmin and cg for each spin seperately
             if scf.log.level <= logging.DEBUG:
-                linmin[spin] = dotprod(g, d_old[spin]) / \
-                    np.sqrt(dotprod(g, g) * dotprod(d_old[spin], d_old[spin]))
-                cg[spin] = dotprod(g, g_old[spin]) / \
-                    np.sqrt(dotprod(g, g) * dotprod(g_old[spin], g_old[spin]))
-            if scf.cgform == 1:  # Fletcher-Reeves
-                beta[spin] = dotprod(g, g) / dotprod(g_old[spin], g_old[spin])
+                linmin[spin] = dotprod(g, d_old[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(d_old[spin], d_old[spin], atoms))
+                cg[spin] = dotprod(g, g_old[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(g_old[spin], g_old[spin], atoms))
+            if restart:
+                beta[spin] = 0
+            elif scf.cgform == 1:  # Fletcher-Reeves
+                beta[spin] = dotprod(g, g, atoms) / dotprod(g_old[spin], g_old[spin], atoms)
             elif scf.cgform == 2:  # Polak-Ribiere
-                beta[spin] = dotprod(g - g_old[spin], g) / \
-                    dotprod(g_old[spin], g_old[spin])
+                beta[spin] = dotprod(g - g_old[spin], g, atoms) / \
+                    dotprod(g_old[spin], g_old[spin], atoms)
             elif scf.cgform == 3:  # Hestenes-Stiefel
-                beta[spin] = dotprod(g - g_old[spin], g) / \
-                    dotprod(g - g_old[spin], d_old[spin])
+                beta[spin] = dotprod(g - g_old[spin], g, atoms) / \
+                    dotprod(g - g_old[spin], d_old[spin], atoms)
             d[spin] = -g + beta[spin] * d_old[spin]
-            gt = grad(scf, spin, scf.W + betat * d[spin])
-            beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+            if linesearch == 'energy':
+                slope[spin] = 2 * dotprod(g, d[spin], atoms)
+            else:
+                gt = grad(scf, spin, scf.W + betat * d[spin])
+                beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
             d_old[spin] = d[spin]
             g_old[spin] = g
-        for spin in range(atoms.Nspin):
-            scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-        c = cost(scf)
+        if linesearch == 'energy':
+            c, betat = _linmin_energy(scf, cost, costs[-1], d, np.sum(slope), betat)
+            beta[:] = betat
+        else:
+            W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+            scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, g_old[:atoms.Nspin], Ndiis)
+            # Restart the conjugation if the update has been changed by the DIIS extrapolation
+            restart = Ndiis > 1 and len(hist) != 1
+            c = cost(scf)
         costs.append(c)
         if condition(scf, costs, linmin, cg):
             break
@@ -301,7 +405,8 @@ def cg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3
 
 
 @name('preconditioned conjugate-gradient minimization')
-def pccg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5):
+def pccg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5,
+         Ndiis=0, linesearch='gradient'):
     '''Preconditioned conjugate-gradient minimization algorithm.
 
     Args:
@@ -312,67 +417,650 @@ def pccg(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat
         cost (Callable): Function that will run every SCF step.
         grad (Callable): Function that calculates the respective gradient.
         condition (Callable): Function to check and log the convergence condition.
-        betat (float): SCF step size.
+        betat (float): SCF step size, i.e., the trial step of the line search.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+            Only used with the gradient line search.
+        linesearch (str): Line search method, i.e., 'gradient' for a secant step from the gradient
+            at a trial step, or 'energy' for a quadratic fit of the energy at a trial step with
+            Armijo backtracking, where the trial step adapts to the last step size.
 
     Returns:
         list: Total energies per SCF cycle.
     '''
     atoms = scf.atoms
     costs = []
+    # History of wave functions and preconditioned gradients for the DIIS extrapolation
+    hist = []
 
     # Scalars that need to be saved for each spin
     linmin = np.empty(atoms.Nspin)
     cg = np.empty(atoms.Nspin)
     beta = np.empty(atoms.Nspin)
+    slope = np.empty(atoms.Nspin)
 
     # Gradients that need to be saved for each spin
-    d = np.empty_like(scf.W, dtype=complex)
-    d_old = np.empty_like(scf.W, dtype=complex)
-    g_old = np.empty_like(scf.W, dtype=complex)
+    d = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    d_old = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    g_old = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
 
     # Do the first step without the linmin and cg test
     for spin in range(atoms.Nspin):
         g = grad(scf, spin, scf.W)
         d[spin] = -atoms.K(g)
-        gt = grad(scf, spin, scf.W + betat * d[spin])
-        beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+        if linesearch == 'energy':
+            slope[spin] = 2 * dotprod(g, d[spin], atoms)
+        else:
+            gt = grad(scf, spin, scf.W + betat * d[spin])
+            beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
         d_old[spin] = d[spin]
         g_old[spin] = g
     # Update wave functions after calculating the gradients for each spin
-    for spin in range(atoms.Nspin):
-        scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
-
-    c = cost(scf)
+    if linesearch == 'energy':
+        c, betat = _linmin_energy(scf, cost, cost(scf), d, np.sum(slope), betat)
+        beta[:] = betat
+    else:
+        W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+        e = atoms.K(g_old[:atoms.Nspin])
+        scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, e, Ndiis)
+        c = cost(scf)
     costs.append(c)
     condition(scf, costs)
+    restart = False
 
     for _ in range(1, Nit):
         for spin in range(atoms.Nspin):
             g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
             # Calculate linmin and cg for each spin seperately
             if scf.log.level <= logging.DEBUG:
-                linmin[spin] = dotprod(g, d_old[spin]) / \
-                    np.sqrt(dotprod(g, g) * dotprod(d_old[spin], d_old[spin]))
-                cg[spin] = dotprod(g, atoms.K(g_old[spin])) / \
-                    np.sqrt(dotprod(g, atoms.K(g)) * dotprod(g_old[spin], atoms.K(g_old[spin])))
-            if scf.cgform == 1:  # Fletcher-Reeves
-                beta[spin] = dotprod(g, atoms.K(g)) / dotprod(g_old[spin], atoms.K(g_old[spin]))
+                linmin[spin] = dotprod(g, d_old[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(d_old[spin], d_old[spin], atoms))
+                cg[spin] = dotprod(g, atoms.K(g_old[spin]), atoms) / \
+                    np.sqrt(dotprod(g, atoms.K(g), atoms) *
+                            dotprod(g_old[spin], atoms.K(g_old[spin]), atoms))
+            if restart:
+                beta[spin] = 0
+            elif scf.cgform == 1:  # Fletcher-Reeves
+                beta[spin] = dotprod(g, atoms.K(g), atoms) / \
+                    dotprod(g_old[spin], atoms.K(g_old[spin]), atoms)
             elif scf.cgform == 2:  # Polak-Ribiere
-                beta[spin] = dotprod(g - g_old[spin], atoms.K(g)) / \
-                    dotprod(g_old[spin], atoms.K(g_old[spin]))
+                beta[spin] = dotprod(g - g_old[spin], atoms.K(g), atoms) / \
+                    dotprod(g_old[spin], atoms.K(g_old[spin]), atoms)
             elif scf.cgform == 3:  # Hestenes-Stiefel
-                beta[spin] = dotprod(g - g_old[spin], atoms.K(g)) / \
-                    dotprod(g - g_old[spin], d_old[spin])
+                beta[spin] = dotprod(g - g_old[spin], atoms.K(g), atoms) / \
+                    dotprod(g - g_old[spin], d_old[spin], atoms)
             d[spin] = -atoms.K(g) + beta[spin] * d_old[spin]
-            gt = grad(scf, spin, scf.W + betat * d[spin])
-            beta[spin] = betat * dotprod(g, d[spin]) / dotprod(g - gt, d[spin])
+            if linesearch == 'energy':
+                slope[spin] = 2 * dotprod(g, d[spin], atoms)
+            else:
+                gt = grad(scf, spin, scf.W + betat * d[spin])
+                beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
             d_old[spin] = d[spin]
             g_old[spin] = g
+        if linesearch == 'energy':
+            c, betat = _linmin_energy(scf, cost, costs[-1], d, np.sum(slope), betat)
+            beta[:] = betat
+        else:
+            W = scf.W[:atoms.Nspin] + beta[:, None, None] * d[:atoms.Nspin]
+            e = atoms.K(g_old[:atoms.Nspin])
+            scf.W[:atoms.Nspin] = _extrapolate(scf, costs, hist, W, e, Ndiis)
+            # Restart the conjugation if the update has been changed by the DIIS extrapolation
+            restart = Ndiis > 1 and len(hist) != 1
+            c = cost(scf)
+        costs.append(c)
+        if condition(scf, costs, linmin, cg):
+            break
+    return costs
+
+
+@name('limited-memory BFGS minimization')
+def lbfgs(scf, Nit, cost=scf_step, grad=get_grad, condition=check_energies, betat=3e-5, Nhist=8,
+          linesearch='gradient'):
+    '''Limited-memory Broyden-Fletcher-Goldfarb-Shanno minimization algorithm.
+
+    The inverse Hessian is approximated from the last steps and gradient changes, starting from the
+    K preconditioner.
+
+    Reference: Math. Comp. 35, 773.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        grad (Callable): Function that calculates the respective gradient.
+        condition (Callable): Function to check and log the convergence condition.
+        betat (float): SCF step size, i.e., the trial step of the line search.
+        Nhist (int): Number of steps and gradient changes kept in the history.
+        linesearch (str): Line search method, i.e., 'gradient' for a secant step from the gradient
+            at a trial step, or 'energy' for a quadratic fit of the energy at a trial step with
+            Armijo backtracking, where the trial step adapts to the last step size.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    atoms = scf.atoms
+    costs = []
+
+    # Scalars that need to be saved for each spin
+    linmin = np.empty(atoms.Nspin)
+    beta = np.empty(atoms.Nspin)
+    slope = np.empty(atoms.Nspin)
+
+    # Gradients that need to be saved for each spin
+    d = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    g_old = np.empty_like(scf.W, dtype=np.result_type(scf.W, np.complex64))
+    # History of steps and gradient changes for each spin
+    hist = [[] for _ in range(atoms.Nspin)]
+
+    # Do the first step without the linmin test
+    for spin in range(atoms.Nspin):
+        g = grad(scf, spin, scf.W)
+        d[spin] = -atoms.K(g)
+        if linesearch == 'energy':
+            slope[spin] = 2 * dotprod(g, d[spin], atoms)
+        else:
+            gt = grad(scf, spin, scf.W + betat * d[spin])
+            beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
+        g_old[spin] = g
+    # Update wave functions after calculating the gradients for each spin
+    if linesearch == 'energy':
+        c, betat = _linmin_energy(scf, cost, cost(scf), d, np.sum(slope), betat)
+        beta[:] = betat
+    else:
         for spin in range(atoms.Nspin):
             scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
+        c = cost(scf)
+    costs.append(c)
+    condition(scf, costs)
+
+    for _ in range(1, Nit):
+        for spin in range(atoms.Nspin):
+            g = grad(scf, spin, scf.W, scf.Y, scf.n, scf.phi, scf.vxc)
+            # Calculate linmin each spin seperately
+            if scf.log.level <= logging.DEBUG:
+                linmin[spin] = dotprod(g, d[spin], atoms) / \
+                    np.sqrt(dotprod(g, g, atoms) * dotprod(d[spin], d[spin], atoms))
+            # Only keep pairs with positive curvature to keep the inverse Hessian positive definite
+            step = beta[spin] * d[spin]
+            if dotprod(g - g_old[spin], step, atoms) > 0:
+                hist[spin].append((step, g - g_old[spin]))
+                del hist[spin][:-Nhist]
+            d[spin] = -_lbfgs_direction(atoms, hist[spin], g)
+            # Restart from the preconditioned gradient if d is no descent direction
+            if dotprod(g, d[spin], atoms) >= 0:
+                hist[spin].clear()
+                d[spin] = -atoms.K(g)
+            if linesearch == 'energy':
+                slope[spin] = 2 * dotprod(g, d[spin], atoms)
+            else:
+                gt = grad(scf, spin, scf.W + betat * d[spin])
+                beta[spin] = betat * dotprod(g, d[spin], atoms) / dotprod(g - gt, d[spin], atoms)
+            g_old[spin] = g
+        if linesearch == 'energy':
+            c, betat = _linmin_energy(scf, cost, costs[-1], d, np.sum(slope), betat)
+            beta[:] = betat
+        else:
+            for spin in range(atoms.Nspin):
+                scf.W[spin] = scf.W[spin] + beta[spin] * d[spin]
+            c = cost(scf)
+        costs.append(c)
+        if condition(scf, costs, linmin):
+            break
+    return costs
+
 
+@name('Pulay density mixing')
+def pulay(scf, Nit, cost=scf_step, condition=check_energies, alpha=0.5, Nhist=8, Ndiag=3):
+    '''SCF cycle with Pulay (DIIS) density mixing.
+
+    Reference: Chem. Phys. Lett. 73, 393.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        alpha (float): Mixing parameter.
+        Nhist (int): Number of densities and residuals kept in the history.
+        Ndiag (int): Number of eigensolver iterations per SCF step.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    def mix(hist, x, F):
+        return _pulay_mix(hist, x, F, alpha, Nhist)
+    return _density_mixing(scf, Nit, mix, cost, condition, _davidson(scf, Ndiag))
+
+
+@name('Anderson density mixing')
+def anderson(scf, Nit, cost=scf_step, condition=check_energies, alpha=0.5, Ndiag=3):
+    '''SCF cycle with Anderson density mixing using the previous step.
+
+    Reference: J. ACM 12, 547.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        alpha (float): Mixing parameter.
+        Ndiag (int): Number of eigensolver iterations per SCF step.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    def mix(hist, x, F):
+        hist.append((x, F))
+        del hist[:-2]
+        if len(hist) == 1:
+            return x + alpha * F
+        x_old, F_old = hist[0]
+        dF = F - F_old
+        dF2 = np.sum(dF * dF)
+        # Fall back to simple mixing if the residual did not change
+        if dF2 < np.finfo(float).eps:
+            return x + alpha * F
+        # Optimal combination of the current and the previous step
+        theta = np.sum(dF * F) / dF2
+        return (x - theta * (x - x_old)) + alpha * (F - theta * dF)
+    return _density_mixing(scf, Nit, mix, cost, condition, _davidson(scf, Ndiag))
+
+
+@name('Broyden density mixing')
+def broyden(scf, Nit, cost=scf_step, condition=check_energies, alpha=0.5, Nhist=8, Ndiag=3):
+    '''SCF cycle with density mixing using Broyden's second method.
+
+    The inverse Jacobian is build from rank-one updates of alpha times the identity.
+
+    Reference: Math. Comp. 19, 577.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        alpha (float): Mixing parameter.
+        Nhist (int): Number of updates kept in the history.
+        Ndiag (int): Number of eigensolver iterations per SCF step.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    def G(updates, v):
+        # Apply the approximate inverse Jacobian G = alpha + \sum_i u_i dF_i^T / (dF_i^T dF_i)
+        return alpha * v + sum(u * np.sum(dF * v) / np.sum(dF * dF) for u, dF in updates)
+
+    updates = []
+
+    def mix(hist, x, F):
+        if hist:
+            x_old, F_old = hist[0]
+            dF = F - F_old
+            # The secant condition G dF = -dx determines the new update
+            # Skip the update if the residual did not change
+            if np.sum(dF * dF) >= np.finfo(float).eps:
+                updates.append((-(x - x_old) - G(updates, dF), dF))
+                del updates[:-Nhist]
+        hist[:] = [(x, F)]
+        return x + G(updates, F)
+    return _density_mixing(scf, Nit, mix, cost, condition, _davidson(scf, Ndiag))
+
+
+@name('simple density mixing')
+def simple(scf, Nit, cost=scf_step, condition=check_energies, alpha=0.5, q0=0.5, Ndiag=3):
+    '''SCF cycle with simple density mixing of Kerker-preconditioned residuals.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        alpha (float): Mixing parameter.
+        q0 (float | str): Screening wave vector of the Kerker preconditioner, see kerker.
+        Ndiag (int): Number of eigensolver iterations per SCF step.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    def mix(hist, x, F):
+        return x + alpha * kerker(scf.atoms, F, q0)
+    return _density_mixing(scf, Nit, mix, cost, condition, _davidson(scf, Ndiag))
+
+
+def kerker(atoms, F, q0=0.5):
+    '''Kerker preconditioner for density residuals.
+
+    Long-wavelength components of the residuals will be damped by G2 / (G2 + q0^2) to suppress
+    charge sloshing in large cells.
+
+    Reference: Phys. Rev. B 23, 3082.
+
+    Args:
+        atoms: Atoms object.
+        F (ndarray): Real-space density residuals per spin channel.
+
+    Keyword Args:
+        q0 (float | str | None): Screening wave vector in 1/Bohr. 'tf' will use the Thomas-Fermi
+            wave vector of the mean valence density. None or 0 will disable the preconditioning.
+
+    Returns:
+        ndarray: Preconditioned residuals.
+    '''
+    if isinstance(q0, str) and q0.lower() == 'tf':
+        # k_TF^2 = 4 k_F / pi with the Fermi wave vector k_F = (3 pi^2 n)^(1/3)
+        kF = (3 * np.pi**2 * np.sum(atoms.f) / atoms.Omega)**(1 / 3)
+        q02 = 4 * kF / np.pi
+    elif not q0:
+        return F
+    else:
+        q02 = q0**2
+    # Transform the residuals of all spins at once by handling them as states
+    FG = atoms.J(F.T) * (atoms.G2 / (atoms.G2 + q02))[:, None]
+    return np.real(atoms.I(FG)).T
+
+
+@name('Chebyshev-filtered subspace iteration')
+def chefsi(scf, Nit, cost=scf_step, condition=check_energies, alpha=0.5, Nhist=8, degree=8,
+           Nextra=4):
+    '''SCF cycle with Chebyshev-filtered subspace iterations and Pulay density mixing.
+
+    Instead of solving the Kohn-Sham equations in every step, a polynomial filter of H is applied
+    on the wave functions, followed by one Rayleigh-Ritz step.
+
+    Reference: J. Comput. Phys. 219, 172.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+
+    Keyword Args:
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        alpha (float): Mixing parameter.
+        Nhist (int): Number of densities and residuals kept in the history.
+        degree (int): Degree of the Chebyshev polynomial.
+        Nextra (int): Number of additional buffer states per spin.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    atoms = scf.atoms
+    rng = Generator(SFC64(42))
+    # Subspaces with additional buffer states, their Rayleigh-Ritz eigenvalues, and upper bounds
+    X = [None] * atoms.Nspin
+    eps = [None] * atoms.Nspin
+    upper = [None] * atoms.Nspin
+
+    def solve(spin):
+        Veff = scf.Veff[spin]
+        W = scf.W[spin]
+        Nstate = W.shape[-1]
+        if X[spin] is None:
+            # Start from the given states and add smooth random states
+            Wextra = rng.standard_normal((len(W), Nextra)) + \
+                1j * rng.standard_normal((len(W), Nextra))
+            project_gamma(atoms, Wextra)
+            X[spin] = np.hstack((W, atoms.K(Wextra).astype(W.dtype)))
+            eps[spin], X[spin] = rayleigh_ritz(scf, Veff, X[spin])
+        upper[spin] = get_upper_bound(scf, Veff)
+        # Damp the unwanted part of the spectrum above the highest calculated eigenvalue
+        X[spin] = chebyshev_filter(scf, Veff, X[spin], degree, eps[spin][0], eps[spin][-1],
+                                   upper[spin])
+        eps[spin], X[spin] = rayleigh_ritz(scf, Veff, X[spin])
+        return X[spin][:, :Nstate]
+
+    def mix(hist, x, F):
+        return _pulay_mix(hist, x, F, alpha, Nhist)
+    return _density_mixing(scf, Nit, mix, cost, condition, solve)
+
+
+def _density_mixing(scf, Nit, mix, cost, condition, solve):
+    '''SCF cycle that mixes input and output densities per spin.
+
+    Args:
+        scf: SCF object.
+        Nit (int): Maximum number of SCF steps.
+        mix (Callable): Function that builds the next input density from the history, the current
+            input density, and the residual.
+        cost (Callable): Function that will run every SCF step.
+        condition (Callable): Function to check and log the convergence condition.
+        solve (Callable): Function that returns new wave functions of a spin in the potential of
+            the input density.
+
+    Returns:
+        list: Total energies per SCF cycle.
+    '''
+    atoms = scf.atoms
+    costs = []
+    hist = []
+
+    # Start from the density and the potentials of the current wave functions
+    c = cost(scf)
+    costs.append(c)
+    if condition(scf, costs):
+        return costs
+    n_in = scf.n_spin
+
+    for _ in range(1, Nit):
+        # Solve the Kohn-Sham equations in the potential of the input density
+        for spin in range(atoms.Nspin):
+            scf.W[spin] = solve(spin)
+        # Calculate the output density and the total energy of the new wave functions
         c = cost(scf)
         costs.append(c)
-        if condition(scf, costs, linmin, cg):
+        if condition(scf, costs):
             break
+        n_in = mix(hist, n_in, scf.n_spin - n_in)
+        _set_potentials(scf, n_in)
     return costs
+
+
+def _davidson(scf, Ndiag):
+    '''Build a solver for _density_mixing that uses the Davidson eigensolver.
+
+    Args:
+        scf: SCF object.
+        Ndiag (int): Number of eigensolver iterations per SCF step.
+
+    Returns:
+        Callable: Solver.
+    '''
+    def solve(spin):
+        return davidson(scf, scf.Veff[spin], scf.W[spin], Ndiag)[1]
+    return solve
+
+
+def _linmin_energy(scf, cost, E0, d, slope, betat, c1=1e-4, Nbacktrack=10):
+    '''Line search along search directions of all spins using total energies.
+
+    The step size is the minimum of the parabola through the energy and its slope at the current
+    wave functions, and the energy at a trial step. The step size will be reduced until the Armijo
+    condition is fulfilled.
+
+    Args:
+        scf: SCF object.
+        cost (Callable): Function that will run every SCF step.
+        E0 (float): Total energy at the current wave functions.
+        d (ndarray): Search directions.
+        slope (float): Derivative of the total energy along the search directions.
+        betat (float): Trial step size.
+
+    Keyword Args:
+        c1 (float): Parameter for the sufficient decrease in the Armijo condition.
+        Nbacktrack (int): Maximum number of backtracking steps.
+
+    Returns:
+        tuple[float, float]: Total energy at the new wave functions and the step size.
+    '''
+    Nspin = scf.atoms.Nspin
+    W = scf.W
+
+    def energy(t):
+        scf.W = W.copy()
+        scf.W[:Nspin] += t * d[:Nspin]
+        return cost(scf)
+
+    Et = energy(betat)
+    curv = (Et - E0 - slope * betat) / betat**2
+    # Expand the step if the energy is not convex along d, but only by a limited factor
+    beta = -slope / (2 * curv) if curv > 0 else 4 * betat
+    beta = min(beta, 4 * betat)
+    E = energy(beta)
+    for _ in range(Nbacktrack):
+        if E <= E0 + c1 * beta * slope:
+            break
+        # Minimum of the parabola through E0, the slope, and the rejected step, kept in bounds
+        beta_new = -slope * beta**2 / (2 * (E - E0 - slope * beta))
+        beta = min(max(beta_new, 0.1 * beta), 0.5 * beta)
+        E = energy(beta)
+    return E, beta
+
+
+def _lbfgs_direction(atoms, hist, g):
+    '''Apply the L-BFGS approximation of the inverse Hessian on a gradient (two-loop recursion).
+
+    Args:
+        atoms: Atoms object.
+        hist (list): History of steps and gradient changes.
+        g (ndarray): Gradient.
+
+    Returns:
+        ndarray: Approximate inverse Hessian applied on the gradient.
+    '''
+    q = g
+    alpha = []
+    for s, y in reversed(hist):
+        a = dotprod(s, q, atoms) / dotprod(y, s, atoms)
+        q = q - a * y
+        alpha.append(a)
+    r = atoms.K(q)
+    # Scale the initial inverse Hessian with the curvature of the last step
+    if hist:
+        s, y = hist[-1]
+        r *= dotprod(s, y, atoms) / dotprod(y, atoms.K(y), atoms)
+    for (s, y), a in zip(hist, reversed(alpha)):
+        b = dotprod(y, r, atoms) / dotprod(y, s, atoms)
+        r = r + (a - b) * s
+    return r
+
+
+def _pulay_mix(hist, x, F, alpha, Nhist):
+    '''Pulay (DIIS) mixing step.
+
+    Args:
+        hist (list): History of input densities and residuals.
+        x (ndarray): Input density.
+        F (ndarray): Residual.
+        alpha (float): Mixing parameter.
+        Nhist (int): Number of densities and residuals kept in the history.
+
+    Returns:
+        ndarray: Next input density.
+    '''
+    return _diis(hist, x + alpha * F, F, Nhist)
+
+
+def _extrapolate(scf, costs, hist, W, e, Ndiis):
+    '''DIIS extrapolation of updated wave functions for the direct minimizations.
+
+    All spin channels will be extrapolated at once, since they are coupled through the total
+    energy. The wave functions will be orthogonalized to keep the error vectors of different steps
+    comparable. The history will be cleared if the total energy increased. If an extrapolated step
+    even lost the gain of the step before, it will be replaced by the plain update of that step.
+
+    Reference: Comput. Mater. Sci. 2, 244.
+
+    Args:
+        scf: SCF object.
+        costs (list): Total energies per SCF step.
+        hist (list): History of wave functions and error vectors.
+        W (ndarray): Updated expansion coefficients of unconstrained wave functions.
+        e (ndarray): Error vector, i.e., the (preconditioned) gradient that has been used in the
+            update.
+        Ndiis (int): Number of wave functions kept for the DIIS extrapolation, disabled if <2.
+
+    Returns:
+        ndarray: Extrapolated wave functions.
+    '''
+    if Ndiis < 2:
+        return W
+    atoms = scf.atoms
+    if len(costs) > 1 and costs[-1] > costs[-2]:
+        # The last step has been extrapolated if the history has more than one entry
+        if len(hist) > 1 and (len(costs) < 3 or costs[-1] > costs[-3]):
+            W = hist[-1][0]
+            hist.clear()
+            return np.asarray([orth(atoms, Wspin, scf.orth) for Wspin in W])
+        hist.clear()
+    W = _diis(hist, W, e, Ndiis, atoms)
+    return np.asarray([orth(atoms, Wspin, scf.orth) for Wspin in W])
+
+
+def _diis(hist, x, e, Nhist, atoms=None):
+    '''Direct inversion in the iterative subspace.
+
+    Extrapolate from the history of iterates, such that the norm of the linear combination of their
+    error vectors is minimal.
+
+    Reference: Chem. Phys. Lett. 73, 393.
+
+    Args:
+        hist (list): History of iterates and error vectors.
+        x (ndarray): Iterate.
+        e (ndarray): Error vector.
+        Nhist (int): Number of iterates and error vectors kept in the history.
+
+    Keyword Args:
+        atoms: Atoms object to calculate the norm of error vectors of wave functions per spin, e.g.,
+            in the Gamma-point mode.
+
+    Returns:
+        ndarray: Extrapolated iterate.
+    '''
+    hist.append((x, e))
+    del hist[:-Nhist]
+    # Minimize the norm of the error sum, with the constraint that the coefficients sum to 1
+    B = np.ones((len(hist) + 1, len(hist) + 1))
+    B[-1, -1] = 0
+    for i in range(len(hist)):
+        for j in range(i + 1):
+            if atoms is None:
+                B[i, j] = np.real(np.vdot(hist[i][1], hist[j][1]))
+            else:
+                B[i, j] = sum(np.real(np.trace(atoms.dot(ei, ej)))
+                              for ei, ej in zip(hist[i][1], hist[j][1]))
+            B[j, i] = B[i, j]
+    rhs = np.zeros(len(hist) + 1)
+    rhs[-1] = 1
+    if atoms is not None:
+        # Almost parallel error vectors, e.g., from small unpreconditioned steps, result in huge
+        # extrapolation coefficients, so drop the oldest iterates until B is well-conditioned
+        while len(hist) > 1 and np.linalg.cond(B) > 1e8:
+            del hist[0]
+            B = np.delete(np.delete(B, 0, 0), 0, 1)
+    c = np.linalg.lstsq(B, rhs[-len(B):], rcond=None)[0][:-1]
+    return sum(ci * xi for ci, (xi, _) in zip(c, hist))
+
+
+def _set_potentials(scf, n_spin):
+    '''Set the potentials of scf from a given density.
+
+    Args:
+        scf: SCF object.
+        n_spin (ndarray): Real-space electronic densities per spin channel.
+    '''
+    atoms = scf.atoms
+    scf.phi = solve_poisson(atoms, np.sum(n_spin, axis=0))
+    # Mixed densities can become slightly negative in regions with almost no density
+    scf.exc, scf.vxc = get_xc_dens(atoms, scf.xc, np.maximum(n_spin, 0), atoms.Nspin)
+    scf.Veff = get_Veff(scf, scf.phi, scf.vxc)
+    return
@@ -21,20 +21,25 @@ These operators can act on six different options, namely
 The active space is the truncated reciprocal space by restricting it with a sphere given by ecut.
 
 Every spin dependence will be handled with handle_spin_gracefully by calling the operators for each
-spin individually.
-'''
-import os
+spin individually. The exceptions are the transformations, that will transform all spins at once.
+
+The FFTs will be calculated with the backend selected in :mod:`~eminus.fft`.
+
+Real-valued fields, e.g., densities and potentials, have a Hermitian-symmetric spectrum. For these
+fields the backward transformation Jdag can only use half of the spectrum with complex-to-real FFTs.
 
+If the Atoms object uses real-valued wave functions, i.e., the Gamma-point mode, the active space
+only holds one G-vector of every pair G and -G. Overlaps of wave functions have to be calculated
+with :func:`~eminus.operators.dot` in this case, since every coefficient represents its partner too.
+
+If the Atoms object has a separate density sampling, real-space fields can be transferred between
+both samplings with the Fourier interpolation and restriction operators.
+'''
 import numpy as np
-from scipy.fft import fftn, ifftn
 
+from .fft import fftn, ifftn, irfftn, rfftn
 from .utils import handle_spin_gracefully
 
-try:
-    THREADS = int(os.environ['OMP_NUM_THREADS'])
-except KeyError:
-    THREADS = None
-
 
 # Spin handling is trivial for this operator
 def O(atoms, W):
@@ -104,7 +109,6 @@ def Linv(atoms, W):
     return out
 
 
-@handle_spin_gracefully
 def I(atoms, W):
     '''Backwards transformation from reciprocal space to real-space.
 
@@ -118,31 +122,12 @@ def I(atoms, W):
     Returns:
         ndarray: The operator applied on W.
     '''
-    n = np.prod(atoms.s)
-    # If W is in the full space do nothing with W
-    if len(W) == len(atoms.G2):
-        Wfft = W
-    else:
-        # Fill with zeros if W is in the active space
-        if W.ndim == 1:
-            Wfft = np.zeros(n, dtype=complex)
-        else:
-            Wfft = np.zeros((n, atoms.Nstate), dtype=complex)
-        Wfft[atoms.active] = W
+    Finv = _backward(atoms, W)
+    # Scale in-place to not allocate another array
+    Finv *= np.prod(atoms.s)
+    return Finv
 
-    if W.ndim == 1:
-        Wfft = Wfft.reshape(atoms.s)
-        Finv = ifftn(Wfft, workers=THREADS).ravel()
-    else:
-        # Here we reshape the input like in the 1d case but add an extra dimension in the end,
-        # holding the number of states
-        Wfft = Wfft.reshape(np.append(atoms.s, atoms.Nstate))
-        # Tell the function that the FFT only has to act on the first 3 axes
-        Finv = ifftn(Wfft, workers=THREADS, axes=(0, 1, 2)).reshape((n, atoms.Nstate))
-    return Finv * n
 
-
-@handle_spin_gracefully
 def J(atoms, W, full=True):
     '''Forward transformation from real-space to reciprocal space.
 
@@ -159,22 +144,12 @@ def J(atoms, W, full=True):
     Returns:
         ndarray: The operator applied on W.
     '''
-    n = np.prod(atoms.s)
-    if W.ndim == 1:
-        Wfft = W.reshape(atoms.s)
-        F = fftn(Wfft, workers=THREADS).ravel()
-    else:
-        Wfft = W.reshape(np.append(atoms.s, atoms.Nstate))
-        F = fftn(Wfft, workers=THREADS, axes=(0, 1, 2)).reshape((n, atoms.Nstate))
-
-    # There is no way to know if J has to transform to the full or the active space
-    # but normally it transforms to the full space
-    if not full:
-        F = F[atoms.active]
-    return F / n
+    F = _forward(atoms, W, full)
+    # Scale in-place to not allocate another array
+    F /= np.prod(atoms.s)
+    return F
 
 
-# No spin handle is needed since J already has one
 def Idag(atoms, W, full=False):
     '''Conjugated backwards transformation from real-space to reciprocal space.
 
@@ -191,13 +166,11 @@ def Idag(atoms, W, full=False):
     Returns:
         ndarray: The operator applied on W.
     '''
-    n = np.prod(atoms.s)
-    F = J(atoms, W, full)
-    return F * n
+    # Idag = n * J, i.e., the unnormalized forward transformation
+    return _forward(atoms, W, full)
 
 
-# No spin handle is needed since I already has one
-def Jdag(atoms, W):
+def Jdag(atoms, W, real=False):
     '''Conjugated forward transformation from reciprocal space to real-space.
 
     This operator acts on the options 3, 4, 5, and 6.
@@ -207,12 +180,59 @@ def Jdag(atoms, W):
         atoms: Atoms object.
         W (ndarray): Expansion coefficients of unconstrained wave functions in reciprocal space.
 
+    Keyword Args:
+        real (bool): Wether W is Hermitian-symmetric, i.e., the result is a real-valued field.
+
     Returns:
         ndarray: The operator applied on W.
     '''
-    n = np.prod(atoms.s)
-    Finv = I(atoms, W)
-    return Finv / n
+    # Jdag = I / n, i.e., the normalized backwards transformation
+    if real:
+        return _backward_real(atoms, W)
+    return _backward(atoms, W)
+
+
+def dot(atoms, A, B):
+    '''Overlap matrix of wave functions in reciprocal space, i.e., Adag B.
+
+    This operator acts on the options 3, 4, 5, and 6.
+
+    Args:
+        atoms: Atoms object.
+        A (ndarray): Expansion coefficients of wave functions in reciprocal space.
+        B (ndarray): Expansion coefficients of wave functions in reciprocal space.
+
+    Returns:
+        ndarray: Overlap matrix, real-valued in the Gamma-point mode.
+    '''
+    if atoms.gamma_idx is None or len(A) != len(atoms.G2c):
+        return A.conj().T @ B
+    # Adag B = 2 Re(Adag B) over the kept G-vectors, while self-conjugated ones only count once
+    # The imaginary parts of self-conjugated coefficients do not contribute to the wave functions
+    w = atoms.gamma_w if A.ndim == 1 else atoms.gamma_w[:, None]
+    sc = atoms.gamma_idx[3]
+    return np.real((w * A).conj().T @ B) - A[sc].imag.T @ B[sc].imag
+
+
+def project_gamma(atoms, W):
+    '''Remove the imaginary parts of self-conjugated coefficients in the Gamma-point mode.
+
+    These parts do not contribute to the wave functions and are invisible to overlaps, so they have
+    to be removed from generated coefficients, e.g., random start vectors, or they will grow
+    unchecked in eigensolvers and minimizers.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients of wave functions in the active reciprocal space.
+
+    Returns:
+        ndarray: W, modified in-place.
+    '''
+    if atoms.gamma_idx is None or not np.iscomplexobj(W):
+        return W
+    idx = (slice(None),) * (W.ndim - 2) + (atoms.gamma_idx[3],)
+    W[idx] = W[idx].real
+    return W
 
 
 @handle_spin_gracefully
@@ -257,3 +277,288 @@ def T(atoms, W, dr):
     if W.ndim == 2:
         factor = factor[:, None]
     return factor * W
+
+
+def interpolate(atoms, W):
+    '''Fourier interpolation of real-space fields from the sampling to the density sampling.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Real-valued fields with the grid dimension as the last axis.
+
+    Returns:
+        ndarray: Fields on the density sampling.
+    '''
+    idx, idx_dens = atoms.dens_idx
+    return _resample(atoms, W, atoms.s, atoms.s_dens, idx, idx_dens)
+
+
+def restrict(atoms, W):
+    '''Fourier restriction of real-space fields from the density sampling to the sampling.
+
+    All components outside of the sampling will be discarded.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Real-valued fields on the density sampling with the grid dimension as the last
+            axis.
+
+    Returns:
+        ndarray: Fields on the sampling.
+    '''
+    idx, idx_dens = atoms.dens_idx
+    return _resample(atoms, W, atoms.s_dens, atoms.s, idx_dens, idx)
+
+
+def _resample(atoms, W, s_in, s_out, idx_in, idx_out):
+    '''Transfer real-space fields between samplings by copying the shared Fourier components.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Real-valued fields with the grid dimension as the last axis.
+        s_in (ndarray): Sampling of W.
+        s_out (ndarray): Sampling of the output.
+        idx_in (ndarray): Indices of the shared components in the input sampling.
+        idx_out (ndarray): Indices of the shared components in the output sampling.
+
+    Returns:
+        ndarray: Fields on the output sampling.
+    '''
+    lead = W.shape[:-1]
+    F = fftn(W.reshape(lead + tuple(s_in)), axes=(-3, -2, -1)).reshape(lead + (-1,))
+    Fout = np.zeros(lead + (np.prod(s_out),), dtype=F.dtype)
+    Fout[..., idx_out] = F[..., idx_in]
+    Wout = ifftn(Fout.reshape(lead + tuple(s_out)), axes=(-3, -2, -1)).reshape(lead + (-1,))
+    return np.real(Wout) * (np.prod(s_out) / np.prod(s_in))
+
+
+def _forward(atoms, W, full=True):
+    '''Unnormalized forward FFT from real-space to the full or the active reciprocal space.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Real-space field.
+
+    Keyword Args:
+        full (bool): Wether to transform in the full or in the active space.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    spin, states, axes = _split_shape(W)
+    # Only transform the parts of the grid that contribute to the active space
+    if not full and atoms.pencils is not None and not np.isrealobj(W):
+        return _forward_pruned(atoms, W)
+    # Real-valued wave functions only need the kept half of the active space
+    if not full and atoms.gamma_idx is not None and np.isrealobj(W):
+        Fhalf = rfftn(W.reshape(spin + tuple(atoms.s) + states), axes=axes)
+        Fhalf = Fhalf.reshape(spin + (-1,) + states)
+        return Fhalf[(slice(None),) * len(spin) + (atoms.gamma_idx[0],)]
+
+    # Real-valued fields are transformed with complex FFTs as well, since filling the full spectrum
+    # from the half spectrum of a real-to-complex FFT costs more than it saves
+    F = fftn(W.reshape(spin + tuple(atoms.s) + states), axes=axes).reshape(W.shape)
+
+    # There is no way to know if J has to transform to the full or the active space
+    # but normally it transforms to the full space
+    if not full:
+        return F[(slice(None),) * len(spin) + (atoms.active,)]
+    return F
+
+
+def _backward(atoms, W):
+    '''Normalized backward FFT from the full or the active reciprocal space to real-space.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients in reciprocal space.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    n = np.prod(atoms.s)
+    spin, states, axes = _split_shape(W)
+    # Arrays in the active space will be zero-padded first
+    if W.shape[len(spin)] != n:
+        if atoms.gamma_idx is not None:
+            return _backward_gamma(atoms, W)
+        if atoms.pencils is not None:
+            return _backward_pruned(atoms, W)
+        return _backward_active(atoms, W)
+    # Here we reshape the input to the grid and add extra dimensions for spins and states
+    # All of them will be transformed in one call, the FFT only acts on the grid axes
+    shape = spin + tuple(atoms.s) + states
+    return ifftn(W.reshape(shape), axes=axes).reshape(spin + (n,) + states)
+
+
+def _backward_active(atoms, W):
+    '''Normalized backward FFT from the active reciprocal space to real-space.
+
+    The states will be zero-padded and transformed in blocks of Nblock states, such that only one
+    buffer of this size is needed.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients in the active reciprocal space.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    n = np.prod(atoms.s)
+    spin, states, _ = _split_shape(W)
+    # Handle all shapes of W as (Nspin, len(G2c), Nstate)
+    Nspin = spin[0] if spin else 1
+    Nstate = states[0] if states else 1
+    W = W.reshape(Nspin, -1, Nstate)
+    Nblock = Nstate if atoms.Nblock is None else min(atoms.Nblock, Nstate)
+    Wfft = _get_buffer(atoms, Nblock, W.dtype)
+
+    # Skip the copy into the output array if everything can be transformed at once
+    if Nspin == 1 and Nblock == Nstate:
+        Wfft = Wfft[:, :Nstate]
+        Wfft[atoms.active] = W[0]
+        Finv = ifftn(Wfft.reshape(tuple(atoms.s) + (Nstate,)), axes=(0, 1, 2))
+        return Finv.reshape(spin + (n,) + states)
+
+    Finv = np.empty((Nspin, n, Nstate), dtype=Wfft.dtype)
+    for spin_idx in range(Nspin):
+        for i in range(0, Nstate, Nblock):
+            Wblock = Wfft[:, :min(Nblock, Nstate - i)]
+            Wblock[atoms.active] = W[spin_idx, :, i:i + Nblock]
+            Finv[spin_idx, :, i:i + Nblock] = ifftn(Wblock.reshape(tuple(atoms.s) + (-1,)),
+                                                    axes=(0, 1, 2)).reshape(n, -1)
+    return Finv.reshape(spin + (n,) + states)
+
+
+def _backward_real(atoms, W):
+    '''Normalized backward FFT from the full reciprocal space to real-valued real-space fields.
+
+    Only the half spectrum of W will be used, i.e., W has to be Hermitian-symmetric.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients in the full reciprocal space.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    spin, states, axes = _split_shape(W)
+    # The half spectrum has the same shape as the real-to-complex FFT output
+    shape = spin + (atoms.s[0], atoms.s[1], atoms.s[2] // 2 + 1) + states
+    Whalf = W[(slice(None),) * len(spin) + (atoms.half,)]
+    return irfftn(Whalf.reshape(shape), s=atoms.s, axes=axes).reshape(W.shape)
+
+
+def _backward_gamma(atoms, W):
+    '''Normalized backward FFT from the active reciprocal space to real-valued wave functions.
+
+    The half spectrum will be filled with the kept coefficients and the conjugated coefficients of
+    their partners in the zero and Nyquist planes of the last axis.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients in the active reciprocal space of the Gamma-point mode.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    s = atoms.s
+    pos, neg_pos, partner, _ = atoms.gamma_idx
+    spin, states, axes = _split_shape(W)
+    idx = (slice(None),) * len(spin)
+    shape = spin + (s[0], s[1], s[2] // 2 + 1) + states
+    Whalf = np.zeros(spin + (np.prod(shape[len(spin):len(spin) + 3]),) + states,
+                     dtype=np.result_type(W.dtype, np.complex64))
+    Whalf[idx + (pos,)] = W
+    Whalf[idx + (neg_pos,)] = W[idx + (partner,)].conj()
+    return irfftn(Whalf.reshape(shape), s=s, axes=axes).reshape(spin + (np.prod(s),) + states)
+
+
+def _forward_pruned(atoms, W):
+    '''Unnormalized forward FFT from real-space to the active reciprocal space using pruned FFTs.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Real-space field.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    s = atoms.s
+    active, pencils, planes = atoms.pencils
+    spin, states, axes = _split_shape(W)
+    idx = (slice(None),) * len(spin)
+    # Transform along the first axis and only keep the planes that contain active G-vectors
+    F = fftn(W.reshape(spin + tuple(s) + states), axes=axes[:1])[idx + (planes,)]
+    # Transform along the second axis and only keep the pencils that contain active G-vectors
+    F = fftn(F, axes=axes[1:2]).reshape(spin + (len(planes) * s[1], s[2]) + states)
+    F = F[idx + (pencils,)]
+    # Transform along the last axis and gather the active G-vectors
+    F = fftn(F, axes=axes[1:2]).reshape(spin + (-1,) + states)
+    return F[idx + (active,)]
+
+
+def _backward_pruned(atoms, W):
+    '''Normalized backward FFT from the active reciprocal space to real-space using pruned FFTs.
+
+    Args:
+        atoms: Atoms object.
+        W (ndarray): Expansion coefficients in the active reciprocal space.
+
+    Returns:
+        ndarray: Transformed field.
+    '''
+    s = atoms.s
+    active, pencils, planes = atoms.pencils
+    spin, states, axes = _split_shape(W)
+    idx = (slice(None),) * len(spin)
+    # Transform the pencils along the last axis that contain active G-vectors
+    dtype = np.result_type(W.dtype, np.complex64)
+    Wfft = np.zeros(spin + (len(pencils) * s[2],) + states, dtype=dtype)
+    Wfft[idx + (active,)] = W
+    Wfft = ifftn(Wfft.reshape(spin + (len(pencils), s[2]) + states), axes=axes[1:2])
+    # Transform the planes along the second axis that contain these pencils
+    Wplanes = np.zeros(spin + (len(planes) * s[1], s[2]) + states, dtype=dtype)
+    Wplanes[idx + (pencils,)] = Wfft
+    Wplanes = ifftn(Wplanes.reshape(spin + (len(planes), s[1], s[2]) + states), axes=axes[1:2])
+    # Transform the full grid along the first axis
+    Wgrid = np.zeros(spin + tuple(s) + states, dtype=dtype)
+    Wgrid[idx + (planes,)] = Wplanes
+    return ifftn(Wgrid, axes=axes[:1]).reshape(spin + (np.prod(s),) + states)
+
+
+def _get_buffer(atoms, Ncol, dtype):
+    '''Get the zero-padded buffer to transform arrays from the active space.
+
+    One buffer per data type is stored in the Atoms object and will only be rebuilt if it has less
+    than Ncol columns. Only the same elements will be written in every call, so all other elements
+    will stay zero and the buffer can be reused.
+
+    Args:
+        atoms: Atoms object.
+        Ncol (int): Minimal number of columns, i.e., states.
+        dtype (dtype): Data type of the array that will be written to the buffer.
+
+    Returns:
+        ndarray: Zero-padded buffer.
+    '''
+    dtype = np.result_type(dtype, np.complex64)
+    if dtype not in atoms.workspace or atoms.workspace[dtype].shape[1] < Ncol:
+        atoms.workspace[dtype] = np.zeros((np.prod(atoms.s), Ncol), dtype=dtype)
+    return atoms.workspace[dtype]
+
+
+def _split_shape(W):
+    '''Split the shape of W into the spin and state dimensions around the grid dimension.
+
+    Arrays can have the shapes (n), (n, Nstate), or (Nspin, n, Nstate).
+
+    Args:
+        W (ndarray): Array in real-space or in reciprocal space.
+
+    Returns:
+        tuple[tuple, tuple, tuple]: Spin dimension, state dimension, and the grid axes.
+    '''
+    spin = W.shape[:1] if W.ndim == 3 else ()
+    states = W.shape[-1:] if W.ndim > 1 else ()
+    return spin, states, tuple(range(len(spin), len(spin) + 3))
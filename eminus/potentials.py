@@ -18,7 +18,7 @@ def harmonic(atoms):
     freq = 2
     dr = norm(atoms.r - np.sum(atoms.R, axis=1) / 2, axis=1)
     Vharm = 0.5 * freq**2 * dr**2
-    return atoms.Jdag(atoms.O(atoms.J(Vharm)))
+    return atoms.Jdag(atoms.O(atoms.J(Vharm)), True)
 
 
 def coulomb(atoms):
@@ -39,7 +39,7 @@ def coulomb(atoms):
     Vcoul[0] = 0
 
     Sf = np.sum(atoms.Sf, axis=0)
-    return atoms.J(Vcoul * Sf)
+    return np.real(atoms.J(Vcoul * Sf))
 
 
 def ge(atoms):
@@ -74,7 +74,7 @@ def ge(atoms):
          np.sum((-1)**n * np.exp(-lamda * rc * n) / n**2)))
 
     Sf = np.sum(atoms.Sf, axis=0)
-    return atoms.J(Vps * Sf)
+    return np.real(atoms.J(Vps * Sf))
 
 
 def init_pot(scf):
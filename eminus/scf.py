@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
 '''SCF class definition.'''
 import copy
+import inspect
 import logging
 import time
 
 import numpy as np
 
-from .dft import guess_gaussian, guess_pseudo, guess_random
+from .dft import guess_gaussian, guess_pseudo, guess_random, orth
 from .energies import Energy, get_Eewald, get_Esic
-from .gth import init_gth_loc, init_gth_nonloc
+from .gth import init_gth_loc, init_gth_nonloc, init_gth_nonloc_rs
 from .io import read_gth
 from .logger import create_logger, get_level
-from .minimizer import cg, lm, pccg, pclm, sd  # noqa: F401
+from .minimizer import anderson, broyden, cg, chefsi, lbfgs, lm, pccg, pclm, pulay, scf_step, \
+    sd, simple  # noqa: F401
 from .potentials import init_pot
 from .version import info
 from .xc import XC_MAP
@@ -48,8 +50,37 @@ class SCF:
             Default: 1
         min (dict | None): Dictionary to set the order and number of steps per minimization method.
 
-            Example: {'sd': 10, 'pccg': 100}; {'pccg': 10, 'lm': 25, 'pclm': 50},
+            Besides the direct minimizations 'sd', 'lm', 'pclm', 'cg', 'pccg', and 'lbfgs', the
+            density mixing SCF cycles 'simple', 'pulay', 'anderson', and 'broyden', and the
+            Chebyshev-filtered subspace iteration 'chefsi' can be used. Keyword arguments for one
+            minimizer can be passed together with the number of steps as a tuple. These take
+            precedence over the keyword arguments passed to run.
+
+            Example: {'sd': 10, 'pccg': 100}; {'pccg': 10, 'lm': 25}; {'pulay': 50};
+            {'sd': 10, 'pclm': (50, {'Ndiis': 6})},
             Default: None (will default to {'pccg': 250})
+        orth (str): Orthogonalization method of the wave functions (case insensitive).
+
+            'lowdin' uses the symmetric orthogonalization. 'cholesky' is cheaper, but it only spans
+            the same subspace, so it can only be used when all occupations per spin are equal.
+
+            Example: 'lowdin'; 'cholesky',
+            Default: 'lowdin'
+        precision (str): Floating-point precision of the wave functions (case insensitive).
+
+            'mixed' will start the minimization in single precision and switch to double precision
+            once the energy changes fall below 1000 times etol.
+
+            Example: 'double'; 'mixed',
+            Default: 'double'
+        nonloc (str): Representation of the non-local GTH projectors (case insensitive).
+
+            'real' applies the projectors in real-space, truncated to spheres around the atoms. This
+            scales better with the cell size and the number of atoms, but the projections are only
+            approximate.
+
+            Example: 'reciprocal'; 'real',
+            Default: 'reciprocal'
         sic (bool): Calculate the Kohn-Sham Perdew-Zunger SIC energy at the end of the SCF step.
 
             Default: False
@@ -62,13 +93,17 @@ class SCF:
             Default: 'info'
     '''
     def __init__(self, atoms, xc='lda,vwn', pot='gth', guess='gaussian', etol=1e-7, cgform=1,
-                 sic=False, min=None, verbose=None):
+                 orth='lowdin', precision='double', nonloc='reciprocal', sic=False, min=None,
+                 verbose=None):
         self.atoms = copy.copy(atoms)  # Atoms object
         self.xc = xc.lower()           # Exchange-correlation functional
         self.pot = pot.lower()         # Used pseudopotential
         self.guess = guess             # Initial wave functions guess
         self.etol = etol               # Total energy convergence tolerance
         self.cgform = cgform           # Conjugate gradient form
+        self.orth = orth.lower()       # Orthogonalization method
+        self.precision = precision.lower()  # Floating-point precision
+        self.nonloc = nonloc.lower()   # Representation of the non-local projectors
         self.sic = sic                 # Calculate the sic energy
         self.min = min                 # Minimization methods
 
@@ -96,29 +131,50 @@ class SCF:
         self.NbetaNL = 0          # Number of projector functions for the non-local gth potential
         self.prj2beta = None      # Index matrix to map to the correct projector function
         self.betaNL = None        # Atomic-centered projector functions
+        self.D = None             # Block-diagonal coupling matrix of the projector functions
+        self.betaNL_rs = None     # Sparse real-space projector functions
         self.print_precision = 6  # Precision of the energy in the minimizer logger
         self.initialize()
 
     def clear(self):
         '''Initialize and clear intermediate results.'''
         self.Y = None       # Orthogonal wave functions
+        self.U = None       # Overlaps of the wave functions per spin
         self.n_spin = None  # Electronic densities per spin
         self.phi = None     # Hartree field
         self.exc = None     # Exchange-correlation energy density
         self.vxc = None     # Exchange-correlation potential
+        self.Veff = None    # Effective potential per spin
         return self
 
     def initialize(self):
         '''Validate inputs, update them and build all necessary parameters.'''
+        # Fail early for unknown methods instead of silently falling back to a default
+        options = {'nonloc': ('reciprocal', 'real'), 'orth': ('lowdin', 'cholesky'),
+                   'precision': ('double', 'mixed')}
+        for option, valid in options.items():
+            if getattr(self, option) not in valid:
+                raise ValueError(f'No {option} found for "{getattr(self, option)}", '
+                                 f'use one of {valid}.')
         if not self.atoms.is_built:
             self.atoms.build()
         self._set_potential()
         self._init_W()
+        # Start in single precision, the minimizers will switch to double precision when needed
+        if self.precision == 'mixed':
+            self.W = self.W.astype(np.complex64)
         self.print_precision = int(abs(np.log10(self.etol))) + 1
         return self
 
     def run(self, **kwargs):
-        '''Run the self-consistent field (SCF) calculation.'''
+        '''Run the self-consistent field (SCF) calculation.
+
+        Keyword Args:
+            **kwargs: Keyword arguments that will be passed to every minimizer that accepts them.
+
+        Returns:
+            float: Total energy.
+        '''
         if self.log.level <= logging.DEBUG:
             info()
         self.log.debug(f'--- System information ---\n{self.atoms}\n'
@@ -146,17 +202,35 @@ class SCF:
         except KeyError:
             self.log.warning('Use a mock functional for the correlation part.')
 
-        # Start minimization procedures
-        Etots = []
-        minimizer_log = {}
+        # The Cholesky orthogonalization only spans the same subspace as the Loewdin one
+        # The energy functional is only invariant under such rotations for equal occupations
+        if self.orth == 'cholesky' and np.any(self.atoms.f != self.atoms.f[:, :1]):
+            self.log.warning('Occupations per spin differ, use the Loewdin orthogonalization.')
+            self.orth = 'lowdin'
+
+        # Check the minimizers and their keyword arguments before starting any of them
+        params = set()
         for imin in self.min:
             try:
-                self.log.info(f'Start {eval(imin).__name__}...')
+                params |= set(inspect.signature(eval(imin)).parameters)
             except NameError:
                 self.log.exception(f'No minimizer found for "{imin}"')
                 raise
+        if set(kwargs) - params:
+            raise TypeError(f'No minimizer accepts the keyword arguments {set(kwargs) - params}')
+
+        # Start minimization procedures
+        Etots = []
+        minimizer_log = {}
+        for imin in self.min:
+            self.log.info(f'Start {eval(imin).__name__}...')
+            Nit, options = self._get_min_options(imin, kwargs)
             start = time.perf_counter()
-            Elist = eval(imin)(self, self.min[imin], **kwargs)  # Call minimizer
+            single = self.W.dtype == np.complex64
+            Elist = eval(imin)(self, Nit, **options)  # Call minimizer
+            # Continue in double precision if the minimizer stopped to switch the precision
+            if single and self.W.dtype != np.complex64 and len(Elist) < Nit:
+                Elist += eval(imin)(self, Nit - len(Elist), **options)
             end = time.perf_counter()
             minimizer_log[imin] = {}  # Create an entry for the current minimizer
             minimizer_log[imin]['time'] = end - start  # Save time in dictionary
@@ -165,6 +239,11 @@ class SCF:
             # Do not start other minimizations if one converged
             if len(Etots) > 1 and abs(Etots[-2] - Etots[-1]) < self.etol:
                 break
+        # Always return the wave functions and energies in double precision
+        if self.W.dtype == np.complex64:
+            self.log.warning('SCF did not switch to double precision.')
+            self.W = self.W.astype(complex)
+            scf_step(self)
         if len(Etots) > 1 and abs(Etots[-2] - Etots[-1]) < self.etol:
             self.log.info(f'SCF converged after {len(Etots)} iterations.')
         else:
@@ -185,7 +264,11 @@ class SCF:
 
         # Calculate SIC energy if desired
         if self.sic:
-            self.energies.Esic = get_Esic(self, self.Y)
+            # The SIC energy depends on the orbitals, so always use Loewdin-orthogonalized ones
+            self.energies.Esic = get_Esic(self, orth(self.atoms, self.W))
+
+        # Drop the buffers of the transformations, they will be rebuilt when needed
+        self.atoms.workspace.clear()
 
         # Print energy data
         if self.log.level <= logging.DEBUG:
@@ -196,6 +279,24 @@ class SCF:
 
     kernel = run
 
+    def _get_min_options(self, imin, kwargs):
+        '''Get the number of steps and the keyword arguments of a minimizer.
+
+        Args:
+            imin (str): Minimizer name.
+            kwargs (dict): Keyword arguments passed to run.
+
+        Returns:
+            tuple[int, dict]: Maximum number of SCF steps and keyword arguments of the minimizer.
+        '''
+        Nit = self.min[imin]
+        options = {}
+        if isinstance(Nit, (list, tuple)):
+            Nit, options = Nit
+        # Only pass the keyword arguments of run that the minimizer accepts
+        params = inspect.signature(eval(imin)).parameters
+        return Nit, {**{key: kwargs[key] for key in kwargs if key in params}, **options}
+
     def _set_potential(self):
         '''Build the potential.'''
         atoms = self.atoms
@@ -204,7 +305,11 @@ class SCF:
                 self.GTH[atoms.atom[ia]] = read_gth(atoms.atom[ia], atoms.Z[ia])
             # Set up the local and non-local part
             self.Vloc = init_gth_loc(self)
-            self.NbetaNL, self.prj2beta, self.betaNL = init_gth_nonloc(self)
+            # Only build one representation of the projectors
+            self.NbetaNL, self.prj2beta, self.betaNL, self.D = \
+                init_gth_nonloc(self, reciprocal=self.nonloc != 'real')
+            if self.nonloc == 'real':
+                self.betaNL_rs = init_gth_nonloc_rs(self)
         else:
             self.Vloc = init_pot(self)
         return
@@ -23,7 +23,7 @@ def diagprod(a, B):
     return a_col * B
 
 
-def dotprod(a, b):
+def dotprod(a, b, atoms=None):
     '''Efficiently calculate the expression a * b.
 
     Add an extra check to make sure the result is never zero since this function is used as a
@@ -33,11 +33,18 @@ def dotprod(a, b):
         a (ndarray): Array of vectors.
         b (ndarray): Array of vectors.
 
+    Keyword Args:
+        atoms: Atoms object to calculate the overlap of wave functions, e.g., in the Gamma-point
+            mode.
+
     Returns:
         float: The expressions result
     '''
     eps = 1e-15  # 2.22e-16 is the range of float64 machine precision
-    res = np.real(np.trace(a.conj().T @ b))
+    if atoms is None:
+        res = np.real(np.trace(a.conj().T @ b))
+    else:
+        res = np.real(np.trace(atoms.dot(a, b)))
     if abs(res) < eps:
         return eps
     return res
@@ -54,14 +61,50 @@ def Ylm_real(l, m, G):
     Returns:
         ndarray: Real spherical harmonics.
     '''
-    eps = 1e-9
     # Account for single vectors
     G = np.atleast_2d(G)
 
     # No need to calculate more for l=0
     if l == 0:
         return 0.5 * np.sqrt(1 / np.pi) * np.ones(len(G))
+    return _Ylm_real(l, m, *_get_angles(G))
+
+
+def Ylm_real_all(lmax, G):
+    '''Calculate all real spherical harmonics up to lmax from cartesian coordinates.
+
+    The angles of G will only be calculated once for all angular momentum numbers.
+
+    Args:
+        lmax (int): Largest angular momentum number.
+        G (ndarray): Recipocal lattice vector or array of lattice vectors.
+
+    Returns:
+        ndarray: Real spherical harmonics, where Ylm is stored in the row l^2 + l + m.
+    '''
+    # Account for single vectors
+    G = np.atleast_2d(G)
+
+    Ylm = np.empty(((lmax + 1)**2, len(G)))
+    Ylm[0] = 0.5 * np.sqrt(1 / np.pi)
+    if lmax > 0:
+        angles = _get_angles(G)
+        for l in range(1, lmax + 1):
+            for m in range(-l, l + 1):
+                Ylm[l**2 + l + m] = _Ylm_real(l, m, *angles)
+    return Ylm
+
 
+def _get_angles(G):
+    '''Calculate the spherical angles of cartesian coordinates.
+
+    Args:
+        G (ndarray): Array of lattice vectors.
+
+    Returns:
+        tuple[ndarray, ndarray, ndarray]: cos(theta), sin(theta), and phi.
+    '''
+    eps = 1e-9
     # cos(theta)=Gz/|G|
     Gm = norm(G, axis=1)
     with np.errstate(divide='ignore', invalid='ignore'):
@@ -77,7 +120,22 @@ def Ylm_real(l, m, G):
     # If Gx=0: phi=pi/2*sign(Gy)
     phi_idx = (eps > G[:, 0]) & (G[:, 0] > -eps)
     phi[phi_idx] = np.pi / 2 * np.sign(G[phi_idx, 1])
+    return cos_theta, sin_theta, phi
+
+
+def _Ylm_real(l, m, cos_theta, sin_theta, phi):
+    '''Calculate real spherical harmonics from spherical angles for l > 0.
 
+    Args:
+        l (int): Angular momentum number.
+        m (int): Magnetic quantum number.
+        cos_theta (ndarray): cos(theta).
+        sin_theta (ndarray): sin(theta).
+        phi (ndarray): phi.
+
+    Returns:
+        ndarray: Real spherical harmonics.
+    '''
     if l == 1:
         if m == -1:   # py
             return 0.5 * np.sqrt(3 / np.pi) * sin_theta * np.sin(phi)
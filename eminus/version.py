@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 '''Package version number and version info function.'''
-import os
 import platform
 import sys
 
@@ -34,15 +33,18 @@ def info():
                 print(f'{pkg.ljust(12)}: Extra not installed')
 
     print('\n--- Performance infos ---')
-    try:
-        THREADS = int(os.environ['OMP_NUM_THREADS'])
-    except KeyError:
-        THREADS = 1
+    # Import it here, since this module will also be executed outside of the package by setup.py
+    from . import fft
+    if fft.THREADS is None:
         print('INFO: No OMP_NUM_THREADS environment variable was found.\n'
               'To improve performance, add "export OMP_NUM_THREADS=THREADS" to your ".bashrc".\n'
-              'Make sure to replace "THREADS", typically with the number of cores your CPU has.')
-    finally:
-        print(f'FFT operations will run on {THREADS} thread{"s" if THREADS != 1 else ""}.')
+              'Make sure to replace "THREADS", typically with the number of cores your CPU has.\n'
+              'Alternatively, set the number of threads with eminus.fft.set_threads.')
+        print(f'FFT operations will use the {fft.BACKEND} backend with its default number of '
+              'threads.')
+    else:
+        print(f'FFT operations will use the {fft.BACKEND} backend on {fft.THREADS} '
+              f'thread{"s" if fft.THREADS != 1 else ""}.')
     return
 
 
@@ -14,6 +14,9 @@ with open('README.md', 'r') as readme, open('CHANGELOG.md', 'r') as changelog:
     long_description = readme.read() + '\n\n' + changelog.read()
 
 extras = {
+    'fftw': [
+        'pyfftw>=0.12.0'  # FFTW interface
+    ],
     'fods': [
         'pyflosic2>=2.0.0rc0'  # PyCOM FOD guessing method
     ],
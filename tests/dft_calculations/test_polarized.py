@@ -19,7 +19,7 @@ E_ref = {
 }
 
 
-def calc_polarized(system):
+def calc_polarized(system, min=None, **kwargs):
     '''Compare total energies for a test system with a reference value (spin-polarized).'''
     file_path = pathlib.Path(inspect.getfile(inspect.currentframe())).parent
     a = 10
@@ -28,11 +28,12 @@ def calc_polarized(system):
     xc = 'lda,vwn'
     guess = 'random'
     etol = 1e-6
-    min = {'sd': 15, 'pccg': 23}
+    if min is None:
+        min = {'sd': 15, 'pccg': 23}
 
     atom, X = read_xyz(str(file_path.joinpath(f'{system}.xyz')))
     atoms = Atoms(atom, X, a=a, ecut=ecut, s=s, verbose='warning')
-    E = USCF(atoms, xc=xc, guess=guess, etol=etol, min=min).run()
+    E = USCF(atoms, xc=xc, guess=guess, etol=etol, min=min).run(**kwargs)
 
     try:
         assert_allclose(E, E_ref[system], atol=etol)
@@ -72,6 +73,11 @@ def test_Ne():
     calc_polarized('Ne')
 
 
+def test_diis():
+    calc_polarized('CH4', min={'sd': 3, 'pclm': 50}, Ndiis=6)
+    calc_polarized('CH4', min={'sd': 3, 'pccg': (50, {'Ndiis': 6})})
+
+
 if __name__ == '__main__':
     import time
     start = time.perf_counter()
@@ -82,5 +88,6 @@ if __name__ == '__main__':
     test_LiH()
     test_CH4()
     test_Ne()
+    test_diis()
     end = time.perf_counter()
     print(f'Test for polarized calculations passed in {end - start:.3f} s.')
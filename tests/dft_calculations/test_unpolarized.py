@@ -2,10 +2,13 @@
 '''Test total energies for a small set of spin-paired systems.'''
 import inspect
 import pathlib
+import warnings
 
+import numpy as np
 from numpy.testing import assert_allclose
 
 from eminus import Atoms, read_xyz, RSCF
+from eminus.minimizer import scf_step
 
 # Total energies from a spin-polarized calculation with PWDFT.jl with same parameters as below
 # Closed-shell systems have the same energy for spin-paired and -polarized calculations
@@ -18,20 +21,23 @@ E_ref = {
 }
 
 
-def calc_unpolarized(system):
-    '''Compare total energies for a test system with a reference value (spin-paired).'''
+def get_atoms(system, gamma=False):
+    '''Build the Atoms object of a test system.'''
     file_path = pathlib.Path(inspect.getfile(inspect.currentframe())).parent
-    a = 10
-    ecut = 10
-    s = 30
+    atom, X = read_xyz(str(file_path.joinpath(f'{system}.xyz')))
+    return Atoms(atom, X, a=10, ecut=10, s=30, gamma=gamma, verbose='warning')
+
+
+def calc_unpolarized(system, min=None, gamma=False, **kwargs):
+    '''Compare total energies for a test system with a reference value (spin-paired).'''
     xc = 'lda,vwn'
     guess = 'random'
     etol = 1e-6
-    min = {'sd': 3, 'pccg': 18}
+    if min is None:
+        min = {'sd': 3, 'pccg': 18}
 
-    atom, X = read_xyz(str(file_path.joinpath(f'{system}.xyz')))
-    atoms = Atoms(atom, X, a=a, ecut=ecut, s=s, verbose='warning')
-    E = RSCF(atoms, xc=xc, guess=guess, etol=etol, min=min).run()
+    atoms = get_atoms(system, gamma=gamma)
+    E = RSCF(atoms, xc=xc, guess=guess, etol=etol, min=min).run(**kwargs)
 
     try:
         assert_allclose(E, E_ref[system], atol=etol)
@@ -63,6 +69,68 @@ def test_Ne():
     calc_unpolarized('Ne')
 
 
+def test_density_mixing():
+    for mixer in ('simple', 'pulay', 'anderson', 'broyden', 'chefsi'):
+        calc_unpolarized('Ne', min={mixer: 25})
+
+
+def test_diis():
+    calc_unpolarized('Ne', min={'sd': 3, 'pclm': 50}, Ndiis=6)
+    # Enable DIIS only for one minimizer
+    calc_unpolarized('Ne', min={'sd': 3, 'pccg': (50, {'Ndiis': 6})})
+    # Keyword arguments of run will only be passed to minimizers that accept them
+    calc_unpolarized('Ne', min={'sd': 3, 'pulay': 25}, Ndiis=6)
+
+
+def test_lbfgs():
+    calc_unpolarized('Ne', min={'sd': 3, 'lbfgs': 18})
+
+
+def test_energy_linesearch():
+    calc_unpolarized('Ne', min={'pccg': 30}, linesearch='energy')
+    # The default minimizers support the energy line search as well
+    E = RSCF(get_atoms('Ne'), guess='random', etol=1e-6).run(linesearch='energy')
+    assert_allclose(E, E_ref['Ne'], atol=1e-6)
+
+
+def test_gamma():
+    calc_unpolarized('CH4', gamma=True)
+    calc_unpolarized('Ne', min={'pulay': 25}, gamma=True)
+    # Both modes have to agree beyond the tolerance of the reference energies
+    E = []
+    for gamma in (False, True):
+        E.append(RSCF(get_atoms('CH4', gamma=gamma), etol=1e-8, min={'sd': 3, 'pccg': 40}).run())
+    assert_allclose(E[1], E[0], atol=1e-7)
+
+
+def test_mixed_precision():
+    atoms = get_atoms('CH4')
+    dtypes = []
+
+    def cost(scf):
+        dtypes.append(scf.W.dtype)
+        return scf_step(scf)
+    E = RSCF(atoms, guess='random', etol=1e-6, precision='mixed').run(cost=cost)
+    # Start in single precision and finish in double precision
+    assert dtypes[0] == np.complex64
+    assert dtypes[-1] == np.complex128
+    assert_allclose(E, E_ref['CH4'], atol=1e-6)
+    # Unconverged calculations will be promoted to double precision as well
+    scf = RSCF(atoms, guess='random', precision='mixed', min={'sd': 3, 'pccg': 6})
+    scf.run()
+    assert scf.W.dtype == np.complex128
+    assert scf.Y.dtype == np.complex128
+    # Following runs will not restart in single precision
+    dtypes = []
+    scf.run(cost=cost)
+    assert all(dtype == np.complex128 for dtype in dtypes)
+    # Real-valued potentials do not raise warnings when casting to the precision of W
+    atoms = Atoms('He', [0, 0, 0], a=10, ecut=10, s=30, verbose='error')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        RSCF(atoms, pot='coulomb', precision='mixed', min={'sd': 2}).run()
+
+
 if __name__ == '__main__':
     import time
     start = time.perf_counter()
@@ -71,5 +139,11 @@ if __name__ == '__main__':
     test_LiH()
     test_CH4()
     test_Ne()
+    test_density_mixing()
+    test_diis()
+    test_lbfgs()
+    test_energy_linesearch()
+    test_gamma()
+    test_mixed_precision()
     end = time.perf_counter()
     print(f'Test for unpolarized calculations passed in {end - start:.3f} s.')
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+'''Test individual components of DFT calculations.'''
+import inspect
+import pathlib
+import tracemalloc
+import warnings
+
+import numpy as np
+from numpy.testing import assert_allclose
+import pytest
+
+from eminus import Atoms, read_xyz, RSCF
+from eminus.dft import apply_Vloc, get_epsilon, H
+from eminus.energies import get_Eewald, get_Fewald
+from eminus.minimizer import anderson, broyden, scf_step
+
+
+def get_atoms(system, gamma=False, verbose='warning'):
+    '''Build the Atoms object of a test system with the parameters of the DFT calculation tests.'''
+    file_path = pathlib.Path(inspect.getfile(inspect.currentframe())).parent
+    atom, X = read_xyz(str(file_path.parent.joinpath('dft_calculations', f'{system}.xyz')))
+    return Atoms(atom, X, a=10, ecut=10, s=30, gamma=gamma, verbose=verbose)
+
+
+def test_minimizer_options():
+    # Keyword arguments that no minimizer accepts will raise an error before the minimization
+    with pytest.raises(TypeError):
+        RSCF(get_atoms('Ne'), min={'sd': 3, 'pulay': 25}).run(linesearch='energy', Nhist=4, N=1)
+
+
+def test_invalid_options():
+    atoms = get_atoms('Ne')
+    for option in ('nonloc', 'orth', 'precision'):
+        with pytest.raises(ValueError):
+            RSCF(atoms, **{option: 'unknown'})
+
+
+def test_unoccupied_states():
+    epsilon = []
+    for gamma in (False, True):
+        scf = RSCF(get_atoms('CH4', gamma=gamma), guess='random', etol=1e-6)
+        scf.run()
+        eps_occ = get_epsilon(scf, scf.W)
+        # The additional states are calculated with LOBPCG in the potential of the occupied ones
+        eps = get_epsilon(scf, scf.W, Nstate=8)
+        Nocc = eps_occ.shape[-1]
+        assert_allclose(eps[:, :Nocc], eps_occ, atol=1e-6)
+        assert np.all(eps[:, Nocc:] > eps_occ[:, -1:])
+        epsilon.append(eps)
+    assert_allclose(epsilon[1], epsilon[0], atol=1e-4)
+
+
+def test_cholesky():
+    for system in ('CH4', 'Ne'):
+        E = []
+        for orth in ('lowdin', 'cholesky'):
+            E.append(RSCF(get_atoms(system), guess='random', etol=1e-6, orth=orth).run())
+        assert_allclose(E[1], E[0], atol=1e-6)
+    # The energy is not invariant under the Cholesky orthogonalization for different occupations
+    atoms = Atoms('B', [0, 0, 0], a=10, ecut=10, s=30, verbose='error')
+    scf = RSCF(atoms, orth='cholesky', min={'sd': 1})
+    scf.run()
+    assert scf.orth == 'lowdin'
+
+
+def test_nonloc_real():
+    atoms = get_atoms('CH4')
+    E_recip = RSCF(atoms, guess='random', etol=1e-6, min={'pulay': 25}).run()
+    scf = RSCF(atoms, guess='random', etol=1e-6, nonloc='real', min={'pulay': 25})
+    E_real = scf.run()
+    # Only the real-space projectors should be built
+    assert scf.betaNL is None
+    # The real-space projectors are only approximate, with an energy offset of about 2e-5 Eh
+    assert_allclose(E_real, E_recip, atol=3e-5)
+    assert E_real > E_recip
+
+
+def test_nblock():
+    scf = RSCF(get_atoms('CH4', verbose='error'), guess='random', min={'sd': 2})
+    scf.run()
+    atoms = scf.atoms
+    # The buffers of the transformations will be dropped after the SCF run
+    assert not atoms.workspace
+    test = []
+    for Nblock in (None, 2):
+        atoms.Nblock = Nblock
+        test.append((apply_Vloc(atoms, scf.Veff[0], scf.W[0]), H(scf, 0, scf.W)))
+    assert_allclose(test[1][0], test[0][0])
+    assert_allclose(test[1][1], test[0][1])
+    # Blocks keep the precision of W
+    assert apply_Vloc(atoms, scf.Veff[0], scf.W[0].astype(np.complex64)).dtype == np.complex64
+
+
+def test_nblock_memory():
+    for nonloc in ('reciprocal', 'real'):
+        scf = RSCF(get_atoms('CH4', verbose='error'), guess='random', nonloc=nonloc, min={'sd': 2})
+        scf.run()
+        atoms = scf.atoms
+        E, peak = [], []
+        for Nblock in (None, 1):
+            atoms.Nblock = Nblock
+            tracemalloc.start()
+            E.append(scf_step(scf))
+            H(scf, 0, scf.W)
+            peak.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            # Only one block of states is transformed at once
+            Ncol = atoms.Nstate if Nblock is None else Nblock
+            assert all(buffer.shape[1] <= Ncol for buffer in atoms.workspace.values())
+            atoms.workspace.clear()
+        assert_allclose(E[1], E[0])
+        # Without blocks all states will be held in real-space at once
+        assert peak[1] < peak[0] - (atoms.Nstate - 1) * len(atoms.r) * 16
+
+
+def test_mixing_stagnation():
+    scf = RSCF(get_atoms('Ne', verbose='error'), min={'pccg': 5})
+    scf.run()
+    n_spin = scf.n_spin.copy()
+    for mixer in (anderson, broyden):
+        # Without updating the density the residuals will not change between the steps
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            mixer(scf, 4, cost=lambda scf: scf.energies.Etot, condition=lambda scf, costs: False)
+        assert np.all(np.isfinite(scf.Veff))
+        assert_allclose(scf.n_spin, n_spin)
+
+
+def test_ewald():
+    for system in ('CH4', 'Ne'):
+        atoms = get_atoms(system).build()
+        # The default tolerance has to hold against a converged sum
+        assert abs(get_Eewald(atoms) - get_Eewald(atoms, gamma=1e-14)) < 1e-8
+
+
+def test_ewald_spme():
+    atoms = get_atoms('CH4').build()
+    assert_allclose(get_Eewald(atoms, spme=True), get_Eewald(atoms), atol=1e-6)
+    assert_allclose(get_Fewald(atoms, spme=True), get_Fewald(atoms), atol=1e-6)
+
+
+if __name__ == '__main__':
+    import time
+    start = time.perf_counter()
+    test_minimizer_options()
+    test_invalid_options()
+    test_unoccupied_states()
+    test_cholesky()
+    test_nonloc_real()
+    test_nblock()
+    test_nblock_memory()
+    test_mixing_stagnation()
+    test_ewald()
+    test_ewald_spme()
+    end = time.perf_counter()
+    print(f'Test for DFT components passed in {end - start:.3f} s.')
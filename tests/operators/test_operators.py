@@ -3,8 +3,11 @@
 import numpy as np
 from numpy.random import randn
 from numpy.testing import assert_allclose
+import pytest
 
 from eminus import Atoms
+from eminus.fft import set_backend
+from eminus.operators import interpolate, restrict
 
 # Create an Atoms object to build mock wave functions
 atoms = Atoms('Ne', [0, 0, 0], ecut=1).build()
@@ -83,6 +86,121 @@ def test_JdagIdag():
         assert_allclose(out, test)
 
 
+def test_J_real():
+    for i in ['full', 'full_single', 'full_spin']:
+        out = atoms.J(W_tests[i])
+        test = atoms.J(W_tests[i].astype(complex))
+        assert_allclose(out, test)
+
+
+def test_Jdag_real():
+    for i in ['full', 'full_single', 'full_spin']:
+        # The transformation of a real-valued field is Hermitian-symmetric
+        W = atoms.J(W_tests[i])
+        out = atoms.Jdag(W, True)
+        test = np.real(atoms.Jdag(W))
+        assert_allclose(out, test)
+
+
+def test_fft_backends():
+    test = atoms.I(W_tests['active_spin'])
+    set_backend('numpy')
+    out = atoms.I(W_tests['active_spin'])
+    set_backend('scipy')
+    assert_allclose(out, test)
+
+
+def test_fft_backend_fftw():
+    pytest.importorskip('pyfftw')
+    from eminus.extras import fftw
+    W = atoms.J(W_tests['full_spin'])
+    test_I = atoms.I(W_tests['active_spin'])
+    test_real = atoms.Jdag(W, True)
+    set_backend('fftw')
+    try:
+        # Repeated calls on the same input must not alter it
+        for _ in range(3):
+            assert_allclose(atoms.I(W_tests['active_spin']), test_I)
+            assert_allclose(atoms.Jdag(W, True), test_real)
+        # The plan cache only keeps the most recently used plans
+        for n in range(1, fftw.MAX_PLANS + 2):
+            fftw.fftw_transform('fftn', np.ones((n, 2), dtype=complex), axes=(0,))
+        assert len(fftw.PLANS) == fftw.MAX_PLANS
+    finally:
+        set_backend('scipy')
+
+
+def test_pruned():
+    atoms_pruned = Atoms('Ne', [0, 0, 0], ecut=1, prune=True).build()
+    for i in ['active', 'active_single', 'active_spin']:
+        out = atoms_pruned.I(W_tests[i])
+        test = atoms.I(W_tests[i])
+        assert_allclose(out, test)
+        out = atoms_pruned.Idag(out)
+        test = atoms.Idag(test)
+        assert_allclose(out, test)
+
+
+def test_workspace():
+    atoms_block = Atoms('Ne', [0, 0, 0], ecut=1, Nblock=2, prune=False).build()
+    W = randn(atoms_block.Nspin, len(atoms_block.G2c), 5)
+    out = atoms_block.I(W)
+    # Only one buffer with the size of one block will be stored
+    assert [buf.shape for buf in atoms_block.workspace.values()] == [(len(atoms_block.G2), 2)]
+    atoms_block.Nblock = None
+    assert_allclose(out, atoms_block.I(W))
+    for i in ['active_single', 'active']:
+        assert_allclose(atoms_block.I(W_tests[i]), atoms.I(W_tests[i]))
+
+
+def test_gamma():
+    atoms_gamma = Atoms('Ne', [0, 0, 0], ecut=1, gamma=True).build()
+    pos, neg_pos, partner, sc = atoms_gamma.gamma_idx
+    A = randn(len(atoms_gamma.G2c), 2) + 1j * randn(len(atoms_gamma.G2c), 2)
+    B = randn(len(atoms_gamma.G2c), 2) + 1j * randn(len(atoms_gamma.G2c), 2)
+    # Build the Hermitian-symmetric coefficients in the full space
+    full = []
+    for W in (A, B):
+        Wfull = np.zeros((len(atoms_gamma.G2), 2), dtype=complex)
+        Wfull[atoms_gamma.neg[atoms_gamma.active]] = W.conj()
+        Wfull[atoms_gamma.active] = W
+        Wfull[atoms_gamma.active[sc]] = W[sc].real
+        full.append(Wfull)
+    out = atoms_gamma.I(A)
+    test = atoms_gamma.I(full[0])
+    assert np.isrealobj(out)
+    assert_allclose(out, test)
+    out = atoms_gamma.Idag(out)
+    test = atoms_gamma.Idag(test, True)[atoms_gamma.active]
+    assert_allclose(out, test)
+    out = atoms_gamma.dot(A, B)
+    test = full[0].conj().T @ full[1]
+    assert_allclose(out, test)
+
+
+def test_gamma_fftw():
+    pytest.importorskip('pyfftw')
+    atoms_gamma = Atoms('Ne', [0, 0, 0], ecut=1, gamma=True).build()
+    W = randn(len(atoms_gamma.G2c), 2) + 1j * randn(len(atoms_gamma.G2c), 2)
+    test = atoms_gamma.I(W)
+    set_backend('fftw')
+    try:
+        # The reused buffer of the backward transformation must not be overwritten
+        for _ in range(3):
+            assert_allclose(atoms_gamma.I(W), test)
+    finally:
+        set_backend('scipy')
+
+
+def test_interpolate_restrict():
+    atoms_dual = Atoms('Ne', [0, 0, 0], ecut=1, dual=9).build()
+    for i in [(len(atoms_dual.r),), (atoms_dual.Nspin, len(atoms_dual.r))]:
+        # Remove the components that are not shared by both samplings
+        test = restrict(atoms_dual, interpolate(atoms_dual, randn(*i)))
+        out = restrict(atoms_dual, interpolate(atoms_dual, test))
+        assert_allclose(out, test)
+
+
 def test_TT():
     dr = randn(3)
     for i in ['active', 'active_single', 'active_spin']:
@@ -100,6 +218,15 @@ if __name__ == '__main__':
     run_operator(test_JI)
     run_operator(test_IdagJdag)
     run_operator(test_JdagIdag)
+    run_operator(test_J_real)
+    run_operator(test_Jdag_real)
+    run_operator(test_fft_backends)
+    run_operator(test_fft_backend_fftw)
+    run_operator(test_pruned)
+    run_operator(test_workspace)
+    run_operator(test_gamma)
+    run_operator(test_gamma_fftw)
+    run_operator(test_interpolate_restrict)
     run_operator(test_TT)
     end = time.perf_counter()
     print(f'Test for operator identities passed in {end - start:.3f} s.')